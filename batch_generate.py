@@ -0,0 +1,39 @@
+import argparse
+import json
+import sys
+
+from dotenv import load_dotenv
+
+# utility 下的模块在导入时读取环境变量（限流、渲染参数、缓存目录等），必须先加载 .env
+load_dotenv()
+
+from utility.batch.batch_runner import DEFAULT_LIMITS, BatchRunner, load_jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量生成校园AI短视频（无需打开网页）")
+    parser.add_argument("topics", help="主题列表文件：.csv（topic,language,style）、.jsonl 或每行一个主题的文本文件")
+    parser.add_argument("-o", "--out-dir", default="batch_output", help="输出目录（包含 checkpoint 与每个作业的 manifest）")
+    parser.add_argument("-j", "--jobs", type=int, default=2, help="同时进行的作业数")
+    for provider, limit in DEFAULT_LIMITS.items():
+        parser.add_argument(f"--{provider}-concurrency", type=int, default=limit,
+                            help=f"{provider} 同时进行的请求/任务上限（默认 {limit}）")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.topics)
+    if not jobs:
+        print("主题列表为空")
+        return 1
+
+    limits = {provider: getattr(args, f"{provider}_concurrency") for provider in DEFAULT_LIMITS}
+    runner = BatchRunner(args.out_dir, limits=limits, max_jobs=args.jobs)
+    manifests = runner.run(jobs)
+
+    summary = [{"job_id": m["job_id"], "topic": m["topic"], "status": m["status"], "output": m.get("output")}
+               for m in manifests]
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0 if all(m["status"] == "done" for m in manifests) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 预生成的样例素材目录（首次运行基准测试时用 ffmpeg 生成）
+MEDIA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".media")
+
+MEDIA_TYPES = {".mp4": "video/mp4", ".mp3": "audio/mpeg", ".png": "image/png"}
+
+
+class ProviderProfile:
+    """
+    模拟服务商的延迟与失败率。
+
+    latency：每个 HTTP 请求的基础延迟（秒），叠加 ±jitter 比例的随机抖动；
+    failure_rate：请求返回 500 或任务最终失败的概率；
+    其余参数为脚本逐句输出间隔、图片任务耗时、Vidu 排队 / 处理耗时（秒）。
+    """
+
+    def __init__(self, latency=0.05, jitter=0.2, failure_rate=0.0, sentence_interval=0.2, image_time=1.0,
+                 vidu_queue_time=2.0, vidu_processing_time=3.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.sentence_interval = sentence_interval
+        self.image_time = image_time
+        self.vidu_queue_time = vidu_queue_time
+        self.vidu_processing_time = vidu_processing_time
+
+    def delay(self, seconds=None):
+        seconds = self.latency if seconds is None else seconds
+        return max(0.0, seconds * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def fails(self):
+        return random.random() < self.failure_rate
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _ffmpeg():
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+
+def ensure_media(size="1920x1080", duration=5, fps=24):
+    """生成（或复用）样例视频、背景音和图片，返回 {扩展名: 路径}。"""
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    tag = f"{size}_{duration}s_{fps}fps"
+    media = {
+        ".mp4": os.path.join(MEDIA_DIR, f"clip_{tag}.mp4"),
+        ".mp3": os.path.join(MEDIA_DIR, f"audio_{duration}s.mp3"),
+        ".png": os.path.join(MEDIA_DIR, "image.png"),
+    }
+    commands = {
+        ".mp4": ["-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}:duration={duration}",
+                 "-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", "veryfast"],
+        ".mp3": ["-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}", "-c:a", "libmp3lame"],
+        ".png": ["-f", "lavfi", "-i", "testsrc2=size=1024x1024:duration=1", "-frames:v", "1"],
+    }
+    for ext, path in media.items():
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{uuid.uuid4().hex}{ext}"
+            subprocess.run([_ffmpeg(), "-y", "-loglevel", "error", *commands[ext], tmp_path], check=True)
+            os.replace(tmp_path, path)
+    return media
+
+
+class _FakeProviderHandler(BaseHTTPRequestHandler):
+    """
+    同一个端口上模拟三家服务商：
+    /deepseek/v1/chat/completions（OpenAI 兼容，支持流式）、
+    /dashscope/api/v1/...（异步图片任务）、/vidu/ent/v2/...（img2video / text2audio 任务），
+    以及 /media/<任务ID>.<扩展名> 返回样例素材。
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def providers(self):
+        return self.server.providers
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        body = self._read_json()
+        profile = self.providers.profile
+        time.sleep(profile.delay())
+        if profile.fails():
+            self._send_json({"code": "InternalError", "message": "模拟的服务端错误"}, status=500)
+            return
+        if self.path.startswith("/deepseek/"):
+            self._chat_completion(body)
+        elif self.path.startswith("/dashscope/"):
+            task_id = self.providers.new_task("image", profile.image_time)
+            self._send_json({"request_id": task_id, "output": {"task_id": task_id, "task_status": "PENDING"}})
+        elif self.path.startswith("/vidu/"):
+            kind = "audio" if self.path.endswith("text2audio") else "video"
+            task_id = self.providers.new_task(kind, profile.vidu_queue_time + profile.vidu_processing_time)
+            self._send_json({"task_id": task_id, "state": "created", "credits": 4 if kind == "video" else 1})
+        else:
+            self.send_error(404)
+
+    def _chat_completion(self, body):
+        topic = body["messages"][-1]["content"]
+        sentences = [f"{topic}的第{i + 1}个场景里同学们在校园中忙碌。" for i in range(self.providers.scenes)]
+        content = json.dumps({"script": "".join(sentences)}, ensure_ascii=False)
+        usage = {"prompt_tokens": 300, "completion_tokens": len(content), "total_tokens": 300 + len(content)}
+        base = {"id": uuid.uuid4().hex, "created": int(time.time()), "model": body.get("model")}
+        if not body.get("stream"):
+            self._send_json({**base, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        # 按句切块，每句之间间隔 sentence_interval，模拟逐字输出
+        chunks = ['{"script": "'] + sentences + ['"}']
+        for text in chunks:
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {"content": text}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.providers.profile.delay(self.providers.profile.sentence_interval))
+        final = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+
+    def do_GET(self):
+        if self.path.startswith("/media/"):
+            self._send_media()
+            return
+        time.sleep(self.providers.profile.delay())
+        task_id = self.path.rstrip("/").split("/")[-1] if self.path.startswith("/dashscope/") else \
+            self.path.split("/tasks/", 1)[-1].split("/", 1)[0]
+        task = self.providers.tasks.get(task_id)
+        if task is None:
+            self.send_error(404)
+            return
+        state = self.providers.task_state(task)
+        media_url = f"{self.providers.base_url}/media/{task_id}{task['ext']}"
+        if self.path.startswith("/dashscope/"):
+            status = {"pending": "PENDING", "running": "RUNNING", "success": "SUCCEEDED", "failed": "FAILED"}[state]
+            output = {"task_id": task_id, "task_status": status}
+            if state == "success":
+                output["results"] = [{"url": media_url}]
+            self._send_json({"request_id": task_id, "output": output, "usage": {"image_count": 1}})
+            return
+        vidu_state = {"pending": "queueing", "running": "processing"}.get(state, state)
+        response = {"id": task_id, "state": vidu_state}
+        if state == "success":
+            response["creations"] = [{"url": media_url}]
+        self._send_json(response)
+
+    def _send_media(self):
+        ext = os.path.splitext(self.path)[-1]
+        path = self.providers.media.get(ext)
+        if path is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", MEDIA_TYPES[ext])
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, "rb") as f:
+            self.wfile.write(f.read())
+
+
+class FakeProviders:
+    """在后台线程中运行的本地模拟服务，start() 后通过 env() 获得指向它的环境变量。"""
+
+    def __init__(self, profile=None, scenes=5, media=None, host="127.0.0.1", port=0):
+        self.profile = profile or ProviderProfile()
+        self.scenes = scenes
+        self.media = media or ensure_media()
+        self.tasks = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _FakeProviderHandler)
+        self._server.daemon_threads = True
+        self._server.providers = self
+        self.base_url = f"http://{host}:{self._server.server_address[1]}"
+
+    def new_task(self, kind, duration):
+        task_id = uuid.uuid4().hex
+        task = {
+            "kind": kind,
+            "ext": {"image": ".png", "video": ".mp4", "audio": ".mp3"}[kind],
+            "created_at": time.monotonic(),
+            "queue_time": self.profile.delay(self.profile.vidu_queue_time) if kind != "image" else 0.0,
+            "duration": self.profile.delay(duration),
+            "failed": self.profile.fails(),
+        }
+        with self._lock:
+            self.tasks[task_id] = task
+        return task_id
+
+    @staticmethod
+    def task_state(task):
+        elapsed = time.monotonic() - task["created_at"]
+        if elapsed < task["queue_time"]:
+            return "pending"
+        if elapsed < task["duration"]:
+            return "running"
+        return "failed" if task["failed"] else "success"
+
+    def env(self):
+        """把各服务商的接口地址指向模拟服务的环境变量。"""
+        return {
+            "DEEPSEEK_API_KEY": "fake",
+            "DEEPSEEK_API_BASE": f"{self.base_url}/deepseek/v1",
+            "DASHSCOPE_API_KEY": "fake",
+            "DASHSCOPE_HTTP_BASE_URL": f"{self.base_url}/dashscope/api/v1",
+            "VIDU_API_KEY": "fake",
+            "VIDU_API_BASE": f"{self.base_url}/vidu/ent/v2",
+        }
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-providers", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.fake_providers import FakeProviders, ProviderProfile, ensure_media  # noqa: E402
+
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports")
+# 与基准报告相比，耗时增加超过该比例视为性能回退
+DEFAULT_THRESHOLD = 0.2
+# 参与回退比较的指标：端到端耗时 + 各阶段 p50 / p95
+COMPARED_FIELDS = ("p50_ms", "p95_ms")
+
+
+def _stats(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.mean(ordered), 1),
+        "p50_ms": round(ordered[len(ordered) // 2], 1),
+        "p95_ms": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 1),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_once(run_idx, style, render_profile=None):
+    """跑一次完整生成（流式剧本 → 图片 → 视频/背景音 → 下载 → 合成），返回该次的计时。"""
+    from utility.workflow import generation
+
+    topic = f"基准测试{run_idx}-{uuid.uuid4().hex[:6]}"
+    result = {"run": run_idx, "topic": topic, "error": None}
+    started_at = time.perf_counter()
+    try:
+        _, scenes = generation.run_pipeline(topic, 1, style)
+        result["pipeline_ms"] = (time.perf_counter() - started_at) * 1000
+        result["scenes"] = len(scenes)
+        result["failed_scenes"] = sum(1 for scene in scenes if scene.get("failed"))
+
+        merge_started_at = time.perf_counter()
+        generation.merge_final_video([scene["video_path"] for scene in scenes],
+                                     [scene["audio_path"] for scene in scenes],
+                                     [scene["text"] for scene in scenes], profile=render_profile)
+        result["merge_ms"] = (time.perf_counter() - merge_started_at) * 1000
+    except Exception as e:
+        result["error"] = str(e)
+    result["total_ms"] = (time.perf_counter() - started_at) * 1000
+    return result
+
+
+def run_benchmark(scenes=5, runs=1, concurrency=1, profile=None, media_size="1920x1080", style="宫崎骏风格",
+                  render_profile=None):
+    """启动模拟服务，跑 runs 次生成（同时进行 concurrency 次），返回报告 dict。"""
+    profile = profile or ProviderProfile()
+    providers = FakeProviders(profile, scenes=scenes, media=ensure_media(size=media_size)).start()
+    workdir = tempfile.mkdtemp(prefix="t2v_bench_")
+    # 缓存、输出和统计都放到独立的临时目录，保证每次基准测试都从冷缓存开始
+    os.environ.update(providers.env())
+    os.environ.update({
+        "ASSET_CACHE_DIR": os.path.join(workdir, "asset_cache"),
+        "SEGMENT_CACHE_DIR": os.path.join(workdir, "segment_cache"),
+        "OUTPUT_DIR": os.path.join(workdir, "outputs"),
+        "WORKSPACE_DIR": os.path.join(workdir, "workspaces"),
+        "METRICS_FILE": os.path.join(workdir, "metrics.jsonl"),
+    })
+    os.chdir(workdir)
+    from utility.metrics import tracer
+
+    started_at = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda i: run_once(i, style, render_profile), range(runs)))
+    finally:
+        providers.stop()
+    wall_seconds = time.perf_counter() - started_at
+
+    succeeded = [r for r in results if r["error"] is None]
+    rendered_scenes = sum(r["scenes"] - r["failed_scenes"] for r in succeeded)
+    return {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "git_commit": _git_commit(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {"scenes": scenes, "runs": runs, "concurrency": concurrency, "media_size": media_size,
+                   "render_profile": render_profile, "profile": profile.as_dict()},
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput": {
+            "runs_per_min": round(len(succeeded) / wall_seconds * 60, 2),
+            "scenes_per_min": round(rendered_scenes / wall_seconds * 60, 2),
+        },
+        "end_to_end": _stats([r["total_ms"] for r in succeeded]),
+        "failed_runs": len(results) - len(succeeded),
+        "stages": tracer.get_tracer().summary(),
+        "counters": tracer.get_tracer().counters(),
+        "runs": results,
+        "workdir": workdir,
+    }
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """与基准报告逐项比较，返回 [(指标, 基准值, 当前值, 变化比例, 是否回退)]。"""
+    rows = []
+
+    def add(name, old, new):
+        if not old or new is None:
+            return
+        change = (new - old) / old
+        rows.append((name, old, new, change, change > threshold))
+
+    for field in COMPARED_FIELDS:
+        add(f"end_to_end.{field}", baseline["end_to_end"].get(field), report["end_to_end"].get(field))
+    old_stages = {stage["name"]: stage for stage in baseline["stages"]}
+    for stage in report["stages"]:
+        old = old_stages.get(stage["name"])
+        if old is None:
+            continue
+        for field in COMPARED_FIELDS:
+            add(f"{stage['name']}.{field}", old[field], stage[field])
+    return rows
+
+
+def print_report(report, comparison=None):
+    print(f"\n== {report['config']['runs']} 次生成 × {report['config']['scenes']} 个场景，"
+          f"并发 {report['config']['concurrency']}，用时 {report['wall_seconds']} s ==")
+    print(f"吞吐：{report['throughput']['runs_per_min']} 次/分钟，{report['throughput']['scenes_per_min']} 场景/分钟；"
+          f"失败 {report['failed_runs']} 次")
+    print(f"端到端：{report['end_to_end']}")
+    print(f"{'阶段':<28}{'次数':>6}{'失败':>6}{'p50 ms':>12}{'p95 ms':>12}{'max ms':>12}")
+    for stage in report["stages"]:
+        print(f"{stage['name']:<28}{stage['count']:>6}{stage['errors']:>6}"
+              f"{stage['p50_ms']:>12}{stage['p95_ms']:>12}{stage['max_ms']:>12}")
+    for counter in report["counters"]:
+        print(f"  {counter}")
+    if comparison:
+        print(f"\n{'与基准比较':<34}{'基准':>12}{'当前':>12}{'变化':>10}")
+        for name, old, new, change, regressed in comparison:
+            print(f"{name:<34}{old:>12}{new:>12}{change:>+10.1%}{'  ⚠️ 回退' if regressed else ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="使用本地模拟服务的离线性能基准测试")
+    parser.add_argument("--scenes", type=int, default=5, help="每次生成的场景数")
+    parser.add_argument("--runs", type=int, default=3, help="总生成次数")
+    parser.add_argument("--concurrency", type=int, default=1, help="同时进行的生成次数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务每个请求的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟随机抖动比例")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="请求 / 任务失败概率")
+    parser.add_argument("--image-time", type=float, default=1.0, help="图片任务耗时（秒）")
+    parser.add_argument("--vidu-queue-time", type=float, default=2.0, help="Vidu 任务排队耗时（秒）")
+    parser.add_argument("--vidu-processing-time", type=float, default=3.0, help="Vidu 任务处理耗时（秒）")
+    parser.add_argument("--media-size", default="1920x1080", help="样例视频分辨率")
+    parser.add_argument("--render-profile", choices=["preview", "final"], help="合成使用的渲染档位，默认 RENDER_PROFILE")
+    parser.add_argument("-o", "--output", help="报告输出路径，默认 benchmark/reports/<时间>.json")
+    parser.add_argument("--baseline", help="用于比较的基准报告")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="判定回退的耗时增加比例")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output or os.path.join(REPORT_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}.json"))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    profile = ProviderProfile(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                              image_time=args.image_time, vidu_queue_time=args.vidu_queue_time,
+                              vidu_processing_time=args.vidu_processing_time)
+    report = run_benchmark(scenes=args.scenes, runs=args.runs, concurrency=args.concurrency, profile=profile,
+                           media_size=args.media_size, render_profile=args.render_profile)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    comparison = compare(report, baseline, args.threshold) if baseline else None
+    if baseline and baseline["config"] != report["config"]:
+        print(f"⚠️ 基准报告的测试配置不同，比较结果仅供参考：{baseline['config']}")
+    print_report(report, comparison)
+    print(f"\n报告已写入 {output}")
+    return 1 if comparison and any(row[4] for row in comparison) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,39 +1,23 @@
-import base64
 import os
 import re
-import shutil
 import time
 import uuid
-from http import HTTPStatus
-from pathlib import PurePosixPath
-from urllib.parse import urlparse, unquote
-import requests
 import streamlit as st
-from dashscope import ImageSynthesis
 from dotenv import load_dotenv
-from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips
-from moviepy.video.VideoClip import TextClip
-from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
-from utility.history.history_manager import SimpleHistory
-from utility.script.script_generator import generate_script
 
-# 加载 .env
+# 加载 .env；utility 下的模块在导入时读取环境变量（API 地址、限流、渲染参数等），必须先加载
 load_dotenv()
-DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
-VIDU_API_KEY = os.getenv("VIDU_API_KEY")
-IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
-VIDU_API_BASE = "https://api.vidu.cn/ent/v2"
-POLL_INTERVAL = 5
-# 替换成你自己的ImageMagick 安装路径
-os.environ["IMAGEMAGICK_BINARY"] = r"D:\Program Files\ImageMagick-7.1.1-Q16\magick.exe"
 
+from utility.history.history_manager import SimpleHistory
+from utility.jobs.job_runner import (ACTIVE_STATES, JOB_FAILED, JOB_INTERRUPTED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED,
+                                    get_job_runner)
+from utility.metrics import tracer
+from utility.network import rate_limiter
+from utility.storage.output_store import output_url, subtitle_file
+# 生成流程与 Streamlit 解耦，较重的依赖在点击对应按钮时才导入
+from utility.workflow import generation
 
-def get_download_link(file_path, file_label):
-    with open(file_path, "rb") as f:
-        data = f.read()
-    b64 = base64.b64encode(data).decode()
-    href = f'<a href="data:video/mp4;base64,{b64}" download="{file_label}.mp4">📥 点击下载最终视频</a>'
-    return href
+IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
 
 
 # 输入合法性检查
@@ -48,124 +32,75 @@ def is_valid_input(language: str, text: str) -> bool:
     return False
 
 
-# 图像生成
-def generate_single_caption_image(style, txt):
-    prompt = f"{style} 风格，{style} 风格，描绘{txt}场景"
-    rsp = ImageSynthesis.call(
-        api_key=DASHSCOPE_API_KEY,
-        model="wanx2.1-t2i-turbo",
-        prompt=prompt,
-        n=1,
-        size='1024*1024'
-    )
-    if rsp.status_code == HTTPStatus.OK:
-        url = rsp.output.results[0].url
-        filename = PurePosixPath(unquote(urlparse(url).path)).parts[-1]
-
-        folder = "images"
-        os.makedirs(folder, exist_ok=True)
-        filepath = os.path.join(folder, filename)
-        with open(filepath, 'wb') as f:
-            f.write(requests.get(url).content)
-
-        return url
+# 更新场景的视频/音频 URL，并丢弃流水线下载的旧本地文件
+def set_scene_asset(kind, idx, url):
+    urls = st.session_state.get(f"{kind}_urls")
+    if not urls or idx >= len(urls):
+        # 场景已被重新生成，旧任务的结果不再适用
+        return
+    urls[idx] = url
+    if st.session_state.get(f"{kind}_paths"):
+        st.session_state[f"{kind}_paths"][idx] = None
+
+
+# 把已完成的后台任务结果写回会话状态
+def apply_job_result(job):
+    result = job["result"]
+    if job["kind"] == JOB_PIPELINE:
+        scenes = result["scenes"]
+        st.session_state.script = result["script"]
+        st.session_state.scene_texts = [scene["text"] for scene in scenes]
+        for key in ["image_url", "video_url", "audio_url", "video_path", "audio_path"]:
+            st.session_state[f"{key}s"] = [scene[key] for scene in scenes]
+    elif job["kind"] == JOB_IMAGES:
+        st.session_state.scene_texts = result["scene_texts"]
+        st.session_state.image_urls = result["urls"]
+        st.session_state.video_urls = None
+        st.session_state.audio_urls = None
+        st.session_state.video_paths = None
+        st.session_state.audio_paths = None
+    elif job["kind"] == JOB_CLIPS:
+        for scene_idx, scene_result in result.items():
+            for kind in ("video", "audio"):
+                if scene_result[kind]:
+                    set_scene_asset(kind, int(scene_idx), scene_result[kind])
     else:
-        raise Exception(f"图像生成失败: {rsp.status_code}, code: {rsp.code}, message: {rsp.message}")
-
-
-# 音频生成
-def generate_audio(prompt, duration=5.0, seed=0):
-    headers = {"Authorization": f"Token {VIDU_API_KEY}", "Content-Type": "application/json"}
-    payload = {
-        "model": "audio1.0",
-        "prompt": prompt,
-        "duration": duration,
-        "seed": seed
-    }
-    res = requests.post(f"{VIDU_API_BASE}/text2audio", headers=headers, json=payload)
-    if res.status_code != 200:
-        raise Exception(f"音频生成请求失败：{res.status_code}")
-    task_id = res.json()["task_id"]
-
-    # 轮询查询任务状态
-    poll_status = st.empty()
-    while True:
-        time.sleep(POLL_INTERVAL)
-        poll = requests.get(f"{VIDU_API_BASE}/tasks/{task_id}/creations", headers=headers)
-        poll_json = poll.json()
-        state = poll_json.get("state", "")
-        if state == "failed":
-            raise Exception("音频生成失败")
-        elif state == "success":
-            poll_status.empty()  # ✅ 清除轮询状态提示
-            return poll_json["creations"][0]["url"]
-        else:
-            poll_status.info(f"🎵 音频生成状态：{state}")
-
-
-def download_file(url, folder, prefix):
-    # 获取文件扩展名，例如 .mp4 或 .mp3
-    path = urlparse(url).path
-    ext = os.path.splitext(path)[-1]
-
-    # 使用 uuid 保证唯一且简短
-    filename = f"{prefix}_{uuid.uuid4().hex}{ext}"
-    local_path = os.path.join(folder, filename)
+        set_scene_asset(job["kind"], job["scene"], result)
 
-    r = requests.get(url, stream=True)
-    r.raise_for_status()
-    with open(local_path, "wb") as f:
-        for chunk in r.iter_content(chunk_size=8192):
-            f.write(chunk)
 
-    return local_path
+def unseen_finished_jobs():
+    # 单独查询所有未处理的已结束任务，不受任务面板只展示最近 JOB_PANEL_SIZE 条的限制
+    finished = job_runner.list_finished(session_id, after_seq=st.session_state.jobs_synced_seq)
+    return [job for job in finished if job["id"] not in st.session_state.seen_jobs]
 
 
-def merge_videos_and_audios(video_urls, audio_urls, captions):
-    # 临时目录
-    tmpdir = "temp_merge"
-    os.makedirs(tmpdir, exist_ok=True)
+def sync_jobs():
+    """按提交顺序应用尚未处理过的已结束任务，返回是否有新结束的任务。"""
+    jobs = unseen_finished_jobs()
+    for job in jobs:
+        st.session_state.seen_jobs.add(job["id"])
+        st.session_state.jobs_synced_seq = max(st.session_state.jobs_synced_seq, job["finished_seq"])
+        if job["status"] == JOB_SUCCEEDED:
+            apply_job_result(job)
+    return bool(jobs)
 
-    video_clips = []
 
-    try:
-        # 下载视频和音频，读取为moviepy对象
-        for i, (v_url, a_url) in enumerate(zip(video_urls, audio_urls)):
-            v_path = download_file(v_url, tmpdir, f"video{i}")
-            a_path = download_file(a_url, tmpdir, f"audio{i}")
+JOB_STATUS_ICONS = {JOB_QUEUED: "⏳", JOB_RUNNING: "📡", JOB_SUCCEEDED: "✅", JOB_FAILED: "❌", JOB_INTERRUPTED: "⚠️"}
 
-            video_clip = VideoFileClip(v_path)
-            audio_clip = AudioFileClip(a_path)
 
-            text = captions[i]
-            subtitle = TextClip(
-                txt=text,
-                fontsize=48,
-                font="冬青黑體簡體中文-W3",  # 建议：Mac: 黑体 Windows: SimHei
-                color='white',
-                stroke_color='black',
-                method='label'
-            ).set_position(("center", video_clip.h - 150)).set_duration(video_clip.duration)
+def render_jobs():
+    if unseen_finished_jobs():
+        # 有任务刚结束：整页重新运行，把结果写回页面
+        st.rerun()
+    session_jobs = job_runner.list_jobs(session_id, limit=JOB_PANEL_SIZE)
+    for job in session_jobs:
+        detail = job["error"] if job["status"] == JOB_FAILED else (job["progress"] or "")
+        st.caption(f"{JOB_STATUS_ICONS.get(job['status'], '')} {job['label']} {detail}")
+    # 服务商限流排队情况（所有会话共享同一份配额）
+    for status in rate_limiter.queue_status():
+        if status["waiting"]:
+            st.caption(f"🚦 {status['name']} 限流排队 {status['waiting']} 个请求，预计等待 {status['wait_seconds']:.0f} 秒")
 
-            composite_clip = CompositeVideoClip([video_clip, subtitle])
-            composite_clip = composite_clip.set_audio(audio_clip)
-
-            video_clips.append(composite_clip)
-
-        final_video = concatenate_videoclips(video_clips, method="compose")
-
-        output_path = os.path.join(tmpdir, "final_video.mp4")
-        final_video.write_videofile(output_path, codec="libx264", audio_codec="aac", fps=25)
-
-        # 读取视频二进制
-        with open(output_path, "rb") as f:
-            video_bytes = f.read()
-
-        return video_bytes
-
-    finally:
-        # 清理临时文件夹（调试时可以注释掉）
-        shutil.rmtree(tmpdir, ignore_errors=True)
 
 # start ui
 st.set_page_config(page_title="校园AI短视频生成器", layout="centered")
@@ -175,14 +110,44 @@ language_option = st.selectbox("请选择语言", ["中文", "English"])
 topic = st.text_input("请输入你想要生成视频的校园主题", "")
 language = 1 if language_option == "中文" else 0
 
+# 后台任务类型
+JOB_PIPELINE = "pipeline"
+JOB_IMAGES = "images"
+JOB_CLIPS = "clips"
+JOB_VIDEO = "video"
+JOB_AUDIO = "audio"
+# 后台任务面板的刷新间隔（秒）和展示条数
+JOB_REFRESH_SECONDS = 2
+JOB_PANEL_SIZE = 10
+
+# 推荐图像风格
+DEFAULT_STYLES = ["宫崎骏风格", "迪士尼卡通", "中国水墨", "儿童绘本风", "像素画风", "油画质感", "赛博朋克", "毕加索风格"]
+
 # 会话变量初始化
-for key in ["script", "scene_texts", "image_urls", "video_urls", "final_video_data", "final_video_url",
-            "final_video_path"]:
+for key in ["script", "scene_texts", "image_urls", "video_urls", "audio_urls", "video_paths", "audio_paths",
+            "final_video_path", "final_video_profile"]:
     st.session_state.setdefault(key, None)
+st.session_state.setdefault("seen_jobs", set())
+# 已应用的已结束任务中最大的结束序号，之后只查询序号更大的任务
+st.session_state.setdefault("jobs_synced_seq", 0)
 
-# 历史记录功能初始化
+# 会话 ID 放在 URL 查询参数中，页面重新运行、刷新浏览器后都能找回本会话的后台任务和历史记录
+if "sid" not in st.query_params:
+    st.query_params["sid"] = uuid.uuid4().hex
+session_id = st.query_params["sid"]
+
+# 历史记录功能初始化，侧边栏只展示本会话的记录
 history = SimpleHistory()
-history.render()
+history.render(session_id=session_id)
+
+# 生成任务在后台线程中执行，页面只读取任务表；任务结束后把结果写回会话状态
+job_runner = get_job_runner()
+sync_jobs()
+jobs = job_runner.list_jobs(session_id, limit=JOB_PANEL_SIZE)
+if jobs:
+    st.markdown("## 📋 后台任务")
+    has_active_jobs = any(job["status"] in ACTIVE_STATES for job in jobs)
+    st.fragment(render_jobs, run_every=JOB_REFRESH_SECONDS if has_active_jobs else None)()
 
 # 主流程 + ui
 st.markdown("## 🖊️ 生成主题剧本")
@@ -197,14 +162,53 @@ if topic:
 
         if st.button("1️⃣ 生成剧本"):
             with st.spinner("生成剧本中..."):
-                st.session_state.script = generate_script(topic, language)
+                # 流式输出：每写完一句就先展示出来
+                script_preview = st.empty()
+                st.session_state.script = generation.write_script(
+                    topic, language,
+                    on_sentence=lambda sentences: script_preview.markdown(
+                        "\n\n".join(f"{i + 1}. {s}" for i, s in enumerate(sentences))))
+                script_preview.empty()
+                history.start_run(topic, language=language_option, session_id=session_id)
                 st.success("✅ 剧本生成完成")
 
+        if st.button("⚡ 流水线一键生成（剧本 → 图片 → 视频/背景音）"):
+            # 每句剧本写完就立即进入图片、视频/音频、下载阶段，不必等其他场景
+            pipeline_style = st.session_state.get("selected_style") or DEFAULT_STYLES[0]
+            history.start_run(topic, language=language_option, style=pipeline_style, session_id=session_id)
+            record = history.background_recorder()
+
+            def run_pipeline_job(report, topic=topic, language=language, style=pipeline_style):
+                finished = []
+
+                def on_pipeline_scene(scene):
+                    finished.append(scene)
+                    failed = f"，场景 {scene['idx'] + 1} 失败：{scene['errors']}" if scene["errors"] else ""
+                    report(f"已完成 {len(finished)} 个场景{failed}")
+
+                script, scenes = generation.run_pipeline(topic, language, style, on_scene=on_pipeline_scene)
+                return {"script": script, "scenes": scenes}
+
+            def record_pipeline(result, style=pipeline_style):
+                for scene in result["scenes"]:
+                    label = f"场景 {scene['idx'] + 1} {scene['text'][:10]}"
+                    if scene["image_url"]:
+                        record(scene["image_url"], f"🖼️ {label} 图片", scene=scene["idx"], prompt=scene["text"],
+                               style=style)
+                    if scene["video_url"]:
+                        record(scene["video_url"], f"🎞️{label} 视频下载", scene=scene["idx"], prompt=scene["text"])
+                    if scene["audio_url"]:
+                        record(scene["audio_url"], f"🎵 {label} 音频下载", scene=scene["idx"],
+                               prompt=generation.audio_prompt(scene["text"]))
+
+            job_runner.submit(session_id, JOB_PIPELINE, run_pipeline_job, label=f"⚡ 流水线生成：{topic}",
+                              on_done=record_pipeline)
+            st.rerun()
+
         if st.session_state.script:
             st.text_area("📜 剧本内容（只读）", st.session_state.script, height=150, disabled=True)
             # 图像风格选择模块（支持推荐标签点击填入）
-            default_styles = ["宫崎骏风格", "迪士尼卡通", "中国水墨", "儿童绘本风", "像素画风", "油画质感", "赛博朋克",
-                              "毕加索风格"]
+            default_styles = DEFAULT_STYLES
 
             st.markdown("## 🖼️ 生成剧本场景")
             st.markdown("🎨 推荐图像风格（点击可填入）：")
@@ -225,50 +229,31 @@ if topic:
             final_style = user_style_input.strip() if user_style_input.strip() else default_styles[0]
 
             if st.button("2️⃣ 智能切分剧本，一键生成所有场景图片"):
-                # 根据语言选择合适的句子分隔符（中文：。；英文：.）
-                if language_option == "中文":
-                    delimiters = "。"  # 可加入感叹号、问号
-                else:
-                    delimiters = "."
-
-                # 正则表达式分割句子（保留分隔符后再 strip）
-                import re
-
-                pattern = rf"([^{delimiters}]*[{delimiters}])"
-                segments = re.findall(pattern, st.session_state.script)
-                st.session_state.scene_texts = [seg.strip() for seg in segments if seg.strip()]
-
-                # 初始化图像URL列表
-                st.session_state.image_urls = [None] * len(st.session_state.scene_texts)
-
-                with st.spinner("生成中..."):
-                    progress = st.progress(0, text="开始生成图片...")
-                    for idx, text in enumerate(st.session_state.scene_texts):
-                        try:
-                            # ✅ 构造带前文的 prompt
-                            if idx > 0:
-                                prev_text = st.session_state.scene_texts[idx - 1]
-                                prompt = f"在“{prev_text}”的前提下，你接下来根据“{text}”生成图片"
-                            else:
-                                prompt = text
-
-                            url = generate_single_caption_image(final_style, prompt)
-                            st.session_state.image_urls[idx] = url
-
-                            progress.progress((idx + 1) / len(st.session_state.scene_texts),
-                                              text=f"已完成第 {idx + 1}/{len(st.session_state.scene_texts)} 张")
-                        except Exception as e:
-                            st.warning(f"第 {idx + 1} 张生成失败：{e}")
-                    progress.empty()
-                    st.success("🎉 所有图片生成完成")
-
-                    for idx, (url, text) in enumerate(zip(st.session_state.image_urls, st.session_state.scene_texts)):
-                        print(f"{url}")
+                # 根据语言选择合适的句子分隔符切分剧本（中文：。；英文：.）
+                scene_texts = generation.split_scenes(st.session_state.script, language)
+                record = history.background_recorder()
+
+                def run_images_job(report, scene_texts=scene_texts, style=final_style):
+                    def on_image_progress(done, total, idx, error):
+                        report(f"已完成第 {done}/{total} 张")
+
+                    # 所有场景并发提交，结果按场景顺序返回，失败场景单独重试
+                    image_urls, image_errors = generation.generate_scene_images(
+                        scene_texts, style, on_progress=on_image_progress)
+                    failed = [idx + 1 for idx, error in enumerate(image_errors) if error is not None]
+                    if failed:
+                        report(f"第 {failed} 张生成失败")
+                    return {"scene_texts": scene_texts, "urls": image_urls,
+                            "errors": [str(error) if error else None for error in image_errors]}
+
+                def record_images(result, style=final_style):
+                    for idx, (url, text) in enumerate(zip(result["urls"], result["scene_texts"])):
                         if url is not None:
-                            history.add_record(url, label=f"🖼️ 场景 {idx + 1} - {text[:10]} 图片")
-                        else:
-                            st.warning("当前资源未生成成功，跳过展示/处理")
-                    st.rerun()
+                            record(url, f"🖼️ 场景 {idx + 1} - {text[:10]} 图片", scene=idx, prompt=text, style=style)
+
+                job_runner.submit(session_id, JOB_IMAGES, run_images_job, label=f"🖼️ 生成 {len(scene_texts)} 张场景图片",
+                                  on_done=record_images)
+                st.rerun()
         # 展示每张图 + 生成视频/音频按钮
         if st.session_state.image_urls:
             if "video_urls" not in st.session_state or st.session_state.video_urls is None:
@@ -276,6 +261,34 @@ if topic:
             if "audio_urls" not in st.session_state or st.session_state.audio_urls is None:
                 st.session_state.audio_urls = [None] * len(st.session_state.image_urls)
 
+            # 一键提交所有场景的视频和背景音任务，在同一个循环里轮询
+            if st.button("🚀 一键生成所有场景视频与背景音"):
+                record = history.background_recorder()
+
+                def run_clips_job(report, image_urls=list(st.session_state.image_urls),
+                                  scene_texts=list(st.session_state.scene_texts)):
+                    def on_vidu_state(scene_idx, kind, state):
+                        kind_label = "视频" if kind == "video" else "背景音"
+                        report(f"场景 {scene_idx + 1} {kind_label}生成状态：{state}")
+
+                    def on_scene_complete(scene_idx, result):
+                        text = scene_texts[scene_idx]
+                        if result["video"]:
+                            record(result["video"], f"🎞️场景 {scene_idx + 1} {text[:10]} 视频下载", scene=scene_idx,
+                                   prompt=text)
+                        if result["audio"]:
+                            record(result["audio"], f"🎵 场景 {scene_idx + 1} {text[:10]} 音频下载", scene=scene_idx,
+                                   prompt=generation.audio_prompt(text))
+                        if result["errors"]:
+                            errors = "；".join(f"{k}: {v}" for k, v in result["errors"].items())
+                            report(f"场景 {scene_idx + 1} 部分任务失败：{errors}")
+
+                    return generation.generate_scene_clips(image_urls, scene_texts,
+                                                           on_scene_complete=on_scene_complete, on_state=on_vidu_state)
+
+                job_runner.submit(session_id, JOB_CLIPS, run_clips_job, label="🚀 生成所有场景视频与背景音")
+                st.rerun()
+
             for idx, (img_url, text) in enumerate(zip(st.session_state.image_urls, st.session_state.scene_texts)):
                 with st.container():
                     st.markdown(f"### 场景{idx + 1}图片")
@@ -290,40 +303,18 @@ if topic:
                     # 生成视频按钮及展示
                     with cols[0]:
                         if st.button(f"🎞️ 生成视频 - 场景 {idx + 1}", key=f"gen_vid_{idx}"):
-                            try:
-                                headers = {"Authorization": f"Token {VIDU_API_KEY}", "Content-Type": "application/json"}
-                                payload = {
-                                    "model": "viduq1",
-                                    "images": [img_url],
-                                    "prompt": text,
-                                    "duration": "5",
-                                    "seed": "0",
-                                    "resolution": "1080p",
-                                    "movement_amplitude": "auto",
-                                    # "bgm": "true"
-                                }
-                                res = requests.post(f"{VIDU_API_BASE}/img2video", headers=headers, json=payload)
-                                task_id = res.json()["task_id"]
-
-                                poll_status = st.empty()
-                                while True:
-                                    time.sleep(POLL_INTERVAL)
-                                    poll = requests.get(f"{VIDU_API_BASE}/tasks/{task_id}/creations", headers=headers)
-                                    state = poll.json().get("state", "")
-                                    if state == "success":
-                                        video_url = poll.json()["creations"][0]["url"]
-                                        st.session_state.video_urls[idx] = video_url
-                                        poll_status.success(f"✅ 场景 {idx + 1} 视频生成成功")
-                                        history.add_record(video_url, label=f"🎞️场景 {idx + 1} {text[:10]} 视频下载")
-                                        st.rerun()
-                                        break
-                                    elif state == "failed":
-                                        poll_status.error(f"❌ 场景 {idx + 1} 视频生成失败")
-                                        break
-                                    else:
-                                        poll_status.info(f"📡 场景 {idx + 1} 视频生成状态：{state}")
-                            except Exception as e:
-                                st.warning(f"场景 {idx + 1} 视频请求失败：{e}")
+                            record = history.background_recorder()
+                            job_runner.submit(
+                                session_id, JOB_VIDEO,
+                                lambda report, img_url=img_url, text=text: generation.generate_scene_video(
+                                    img_url, text, on_state=lambda state: report(f"生成状态：{state}")),
+                                scene=idx, label=f"🎞️ 场景 {idx + 1} 视频",
+                                on_done=lambda url, idx=idx, text=text: record(
+                                    url, f"🎞️场景 {idx + 1} {text[:10]} 视频下载", scene=idx, prompt=text))
+                            st.rerun()
+                        active_job = job_runner.find_active(session_id, JOB_VIDEO, idx)
+                        if active_job:
+                            st.info(f"📡 场景 {idx + 1} 视频生成中 {active_job['progress'] or ''}")
 
                         if st.session_state.video_urls[idx]:
                             st.video(st.session_state.video_urls[idx], format="video/mp4")
@@ -331,18 +322,21 @@ if topic:
                     # 生成音频按钮及展示
                     with cols[1]:
                         if st.button(f"🎵 生成背景音 - 场景 {idx + 1}", key=f"gen_audio_{idx}"):
-                            try:
-                                st.empty()
-                                audio_url = generate_audio(
-                                    prompt="舒缓小声的，音色干净的不要炸耳朵的，为" + text + "场景做的的轻快连贯重复不停的背景音乐",
-                                    duration=5.0)
-                                st.session_state.audio_urls[idx] = audio_url
-                                st.success(f"✅ 场景 {idx + 1}{text[:10]} 背景音生成成功")
-                                history.add_record(audio_url, label=f"🎵 场景 {idx + 1} {text[:10]} 音频下载")
-                                st.rerun()
-
-                            except Exception as e:
-                                st.warning(f"❌ 场景 {idx + 1} 音频生成失败：{e}")
+                            record = history.background_recorder()
+                            # 场景视频已生成时，背景音按视频的实际时长生成
+                            video_ref = st.session_state.video_urls[idx]
+                            job_runner.submit(
+                                session_id, JOB_AUDIO,
+                                lambda report, text=text, video_ref=video_ref: generation.generate_scene_audio(
+                                    text, on_state=lambda state: report(f"生成状态：{state}"), video_ref=video_ref),
+                                scene=idx, label=f"🎵 场景 {idx + 1} 背景音",
+                                on_done=lambda url, idx=idx, text=text: record(
+                                    url, f"🎵 场景 {idx + 1} {text[:10]} 音频下载", scene=idx,
+                                    prompt=generation.audio_prompt(text)))
+                            st.rerun()
+                        active_job = job_runner.find_active(session_id, JOB_AUDIO, idx)
+                        if active_job:
+                            st.info(f"🎵 场景 {idx + 1} 背景音生成中 {active_job['progress'] or ''}")
 
                         if st.session_state.audio_urls[idx]:
                             st.audio(st.session_state.audio_urls[idx], format="audio/mp3")
@@ -355,39 +349,37 @@ if topic:
 
             if all_video_ready and all_audio_ready:
                 st.markdown("## 🤩 生成最终短视频")
-                if st.button("## 🎬 合成最终视频"):
+                preview_col, final_col = st.columns(2)
+                # 预览版 480p、低码率，编码快几倍，适合先检查节奏和字幕，满意后再合成最终视频
+                preview_clicked = preview_col.button("⚡ 快速预览（480p）")
+                final_clicked = final_col.button("## 🎬 合成最终视频")
+                if preview_clicked or final_clicked:
+                    profile = "preview" if preview_clicked else "final"
                     with st.status("🎬 视频合成中，请稍候...", expanded=True) as status:
                         try:
-                            # 原始数据
-                            video_urls = st.session_state.video_urls
-                            audio_urls = st.session_state.audio_urls
-                            captions = st.session_state.scene_texts
-
-                            # ✅ 只保留那些视频和音频都已生成的场景
+                            # 原始数据（流水线已下载到本地的素材优先使用本地文件；
+                            # 流水线的工作目录可能已被按闲置时间 / 总大小清理，文件不在时改用远程 URL）
+                            video_paths = st.session_state.video_paths or [None] * len(st.session_state.video_urls)
+                            audio_paths = st.session_state.audio_paths or [None] * len(st.session_state.audio_urls)
+                            video_urls = [p if p and os.path.exists(p) else u
+                                          for p, u in zip(video_paths, st.session_state.video_urls)]
+                            audio_urls = [p if p and os.path.exists(p) else u
+                                          for p, u in zip(audio_paths, st.session_state.audio_urls)]
+
+                            # ✅ 只合成那些视频和音频都已生成的场景
                             # 出于测试目的（在不是5个场景都生成的时候，测试时），只暂时拼接其中几个场景
-                            valid_data = [
-                                (v, a, c) for v, a, c in zip(video_urls, audio_urls, captions)
-                                if v is not None and a is not None
-                            ]
-
-                            # 拆分成各自列表
-                            video_urls_filtered, audio_urls_filtered, captions_filtered = zip(*valid_data)
-
-                            video_data = merge_videos_and_audios(
-                                video_urls_filtered,
-                                audio_urls_filtered,
-                                captions_filtered
-                            )
-                            st.success("✅ 合成完成！播放最终视频：")
-                            st.video(video_data)
+                            # 合成结果直接写入输出目录，返回文件路径，不再读回内存
+                            merge_started_at = time.perf_counter()
+                            output_path = generation.merge_final_video(
+                                video_urls, audio_urls, st.session_state.scene_texts, profile=profile)
+                            st.success("✅ 合成完成！")
                             status.update(label="✅ 合成完成", state="complete")
-                            # 合成视频之后：
-                            output_path = "/tmp/final_video.mp4"
-                            with open(output_path, "wb") as f:
-                                f.write(video_data)
                             st.session_state.final_video_path = output_path
-                            history.add_record(output_path, label=f"🎬 {topic} 合成视频下载", is_file=True,
-                                               filename="final_video")
+                            st.session_state.final_video_profile = profile
+                            if profile == "final":
+                                history.add_record(output_path, label=f"🎬 {topic} 合成视频下载", is_file=True,
+                                                   filename="final_video",
+                                                   duration_ms=(time.perf_counter() - merge_started_at) * 1000)
                             st.rerun()
                         except Exception as e:
                             st.error(f"❌ 合成失败：{e}")
@@ -395,4 +387,19 @@ if topic:
 
 if st.session_state.final_video_path:
     # st.markdown("✌️ 合成成功！！最终视频：")
-    st.video(st.session_state.final_video_path)
+    # 通过文件服务的 URL 播放，浏览器按 Range 请求从磁盘流式读取
+    if st.session_state.final_video_profile == "preview":
+        st.caption("👀 当前为预览版（最高 480p、低码率），确认无误后点击「合成最终视频」")
+    # 软字幕（.srt）由播放器叠加显示；字幕烧进画面时没有 .srt
+    st.video(output_url(st.session_state.final_video_path), format="video/mp4",
+             subtitles=subtitle_file(st.session_state.final_video_path))
+
+# 性能统计：各阶段 / 各场景耗时与 API 用量，明细写入 metrics.jsonl
+with st.expander("📊 性能统计"):
+    span_summary = tracer.get_tracer().summary()
+    if span_summary:
+        st.dataframe(span_summary, hide_index=True)
+        st.dataframe(tracer.get_tracer().counters(), hide_index=True)
+    else:
+        st.caption("暂无统计数据")
+    st.caption(f"Prometheus 指标：{tracer.metrics_url()}")
@@ -0,0 +1,37 @@
+import os
+import sys
+
+# 测试不写 metrics.jsonl；测试用的服务商限流放宽，避免排队拖慢用例
+os.environ["METRICS_FILE"] = ""
+os.environ["RATE_LIMITS"] = "vidu=100/100,throttled=50/1,exhausted=50/1"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from benchmark.fake_providers import FakeProviders, ProviderProfile, ensure_media
+from utility.vidu.poller import TaskPoller
+
+# 测试用的轮询间隔：每个状态 50 毫秒查询一次
+FAST_INTERVALS = {"created": 0.05, "queueing": 0.05, "processing": 0.05}
+
+
+@pytest.fixture(scope="session")
+def media():
+    return ensure_media(size="320x240")
+
+
+@pytest.fixture
+def fake_vidu(media):
+    """本地模拟的 Vidu 服务：任务排队 0.2 秒、再处理 0.3 秒后成功，没有随机失败。"""
+    providers = FakeProviders(ProviderProfile(latency=0.0, jitter=0.0, vidu_queue_time=0.2,
+                                              vidu_processing_time=0.3), media=media).start()
+    yield providers
+    providers.stop()
+
+
+@pytest.fixture
+def make_poller(fake_vidu):
+    def make(deadline=10, **options):
+        return TaskPoller("test", api_base=f"{fake_vidu.base_url}/vidu/ent/v2", deadline=deadline,
+                          initial_delay=0.05, state_intervals=FAST_INTERVALS, max_interval=0.1, **options)
+    return make
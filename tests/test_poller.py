@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from utility.network import http_client
+from utility.vidu.poller import PollBackoff, PollTimeout, TaskQueryError
+from utility.vidu.task_scheduler import text2audio_payload
+
+
+def submit_audio(poller, prompt="测试背景音"):
+    res = http_client.post(f"{poller.api_base}/text2audio", headers=poller.headers,
+                           json=text2audio_payload(prompt, duration=2))
+    res_json = res.json()
+    poller.submitted(res_json["task_id"], "audio", res_json)
+    return res_json["task_id"]
+
+
+def test_wait_returns_result_and_reports_states(make_poller):
+    poller = make_poller()
+    task_id = submit_audio(poller)
+    states = []
+
+    poll_json = poller.wait(task_id, on_state=states.append)
+
+    assert poll_json["state"] == "success"
+    assert poll_json["creations"][0]["url"].endswith(".mp3")
+    assert states[-1] == "success"
+    assert "queueing" in states and "processing" in states
+    assert poller.poll_counts[task_id] == len(states)
+
+
+def test_usage_records_duration_and_credits(make_poller):
+    poller = make_poller()
+    url = poller.wait(submit_audio(poller))["creations"][0]["url"]
+
+    usage = poller.usage(url)
+    assert usage["cost"] == 1
+    assert usage["duration_ms"] >= 400
+    assert poller.usage("http://example.com/other.mp3") == {}
+
+
+def test_unknown_task_fails_fast(make_poller):
+    poller = make_poller()
+    started_at = time.monotonic()
+
+    with pytest.raises(TaskQueryError) as info:
+        poller.wait("missing-task")
+
+    assert info.value.status_code == 404
+    assert info.value.permanent
+    assert time.monotonic() - started_at < 1
+
+
+def test_deadline_raises_poll_timeout(make_poller):
+    poller = make_poller(deadline=0.2)
+    task_id = submit_audio(poller)
+
+    with pytest.raises(PollTimeout):
+        poller.wait(task_id)
+
+
+@pytest.mark.parametrize("status, permanent", [(401, True), (404, True), (408, False), (429, False), (503, False)])
+def test_query_error_classification(status, permanent):
+    assert TaskQueryError("task", status).permanent is permanent
+
+
+def test_backoff_grows_while_state_unchanged_and_resets_on_change():
+    backoff = PollBackoff(state_intervals={"queueing": 1.0, "processing": 0.5}, backoff_factor=2.0,
+                          max_interval=3.0, jitter=0.0)
+
+    assert [backoff.next_interval("queueing") for _ in range(4)] == [1.0, 2.0, 3.0, 3.0]
+    assert backoff.next_interval("processing") == 0.5
@@ -0,0 +1,110 @@
+import threading
+import time
+
+from utility.network.rate_limiter import SharedTokenBucket, TokenBucket, call_limited, get_limiter
+
+
+class FakeResponse:
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待条件超时"
+        time.sleep(0.005)
+
+
+def test_acquire_spaces_requests_by_rate():
+    bucket = TokenBucket("spacing", rate=20, burst=1)
+    started_at = time.monotonic()
+
+    for _ in range(6):
+        bucket.acquire()
+
+    # 第一个许可立即可用，之后每个间隔 1/20 秒
+    assert time.monotonic() - started_at >= 0.25 * 0.9
+
+
+def test_waiters_acquire_in_arrival_order():
+    bucket = TokenBucket("fifo", rate=20, burst=1)
+    # 暂停发放许可，让所有请求先排好队
+    bucket.throttle(retry_after=0.3)
+    order = []
+    threads = []
+    for i in range(5):
+        thread = threading.Thread(target=lambda i=i: (bucket.acquire(), order.append(i)))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: len(bucket._queue) == i + 1)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_on_wait_reports_queue_position():
+    bucket = TokenBucket("report", rate=20, burst=1)
+    bucket.throttle(retry_after=0.2)
+    reports = []
+
+    waited = bucket.acquire(on_wait=lambda position, wait: reports.append((position, wait)))
+
+    assert waited >= 0.15
+    assert reports and reports[0][0] == 0 and reports[0][1] > 0
+
+
+def test_throttle_pauses_and_halves_rate_then_recovers():
+    bucket = TokenBucket("throttle", rate=10, burst=2)
+    bucket.throttle(retry_after=0.2)
+    assert bucket.status()["rate"] == 5
+
+    started_at = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - started_at >= 0.2
+
+    bucket.on_success()
+    assert bucket.status()["rate"] == 6
+
+
+def test_call_limited_retries_after_429():
+    responses = [FakeResponse(429, retry_after=0.05), FakeResponse(200)]
+    sent = []
+
+    def send():
+        sent.append(time.monotonic())
+        return responses[len(sent) - 1]
+
+    result = call_limited("throttled", send)
+
+    assert result.status_code == 200
+    assert len(sent) == 2
+    assert sent[1] - sent[0] >= 0.05
+    assert get_limiter("throttled").status()["rate"] < 50
+
+
+def test_call_limited_gives_up_after_max_retries():
+    sent = []
+
+    def send():
+        sent.append(1)
+        return FakeResponse(429, retry_after=0.01)
+
+    result = call_limited("exhausted", send, max_retries=2)
+
+    assert result.status_code == 429
+    assert len(sent) == 3
+
+
+def test_shared_bucket_spans_instances(tmp_path):
+    # 两个实例相当于两个进程：共用状态文件里的同一份配额
+    first = SharedTokenBucket("shared", rate=20, burst=1, directory=str(tmp_path))
+    second = SharedTokenBucket("shared", rate=20, burst=1, directory=str(tmp_path))
+    started_at = time.monotonic()
+
+    for bucket in (first, second, first, second):
+        bucket.acquire()
+
+    assert time.monotonic() - started_at >= 0.15 * 0.9
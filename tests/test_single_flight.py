@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from utility.cache.single_flight import SingleFlight
+
+
+def run_in_threads(count, target):
+    results, errors = [None] * count, [None] * count
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls, joins = [], []
+
+    def generate():
+        calls.append(1)
+        release.wait(2)
+        return "url"
+
+    threads, results, errors = run_in_threads(5, lambda: flight.do("key", generate, on_join=lambda: joins.append(1)))
+    deadline = time.monotonic() + 2
+    while len(joins) < 4 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert calls == [1]
+    assert len(joins) == 4
+    assert results == ["url"] * 5 and errors == [None] * 5
+    assert flight.in_flight() == 0
+
+
+def test_leader_error_reaches_every_joiner_and_releases_key():
+    flight = SingleFlight()
+    future, leader = flight.begin("key")
+    assert leader
+
+    threads, results, errors = run_in_threads(3, lambda: flight.do("key", lambda: "unused"))
+    time.sleep(0.05)
+    error = RuntimeError("生成失败")
+    flight.finish("key", error=error)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert errors == [error] * 3
+    assert results == [None] * 3
+    # 失败后键被移除，下一次调用重新生成
+    assert flight.in_flight() == 0
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_leader_exception_propagates_from_do():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError, match="bad prompt"):
+        flight.do("key", fail)
+    assert flight.in_flight() == 0
+
+
+def test_joiner_timeout():
+    flight = SingleFlight()
+    flight.begin("key")
+
+    with pytest.raises(TimeoutError):
+        flight.do("key", lambda: "unused", timeout=0.05)
+    flight.finish("key", "done")
@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+from utility.cache.asset_cache import AssetCache
+from utility.vidu.task_scheduler import TASK_AUDIO, ViduTaskScheduler, audio_cache_key, text2audio_payload
+
+PROMPT = "测试背景音"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AssetCache(root=str(tmp_path / "cache"))
+
+
+def vidu_tasks(fake_vidu, kind):
+    return [task for task in fake_vidu.tasks.values() if task["kind"] == kind]
+
+
+def run_all(*schedulers):
+    results = {}
+    threads = [threading.Thread(target=lambda s=s: results.__setitem__(s, s.run())) for s in schedulers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return [results[s] for s in schedulers]
+
+
+def test_identical_tasks_are_submitted_once(fake_vidu, make_poller, cache):
+    leader = ViduTaskScheduler("test", poller=make_poller(), cache=cache)
+    joiner = ViduTaskScheduler("test", poller=make_poller(), cache=cache)
+    leader.submit_text2audio(0, PROMPT, duration=2)
+    joiner.submit_text2audio(3, PROMPT, duration=2)
+    assert len(joiner.joined) == 1
+
+    leader_results, joiner_results = run_all(leader, joiner)
+
+    assert len(vidu_tasks(fake_vidu, "audio")) == 1
+    assert leader_results[0][TASK_AUDIO] is not None
+    assert joiner_results[3][TASK_AUDIO] == leader_results[0][TASK_AUDIO]
+    assert cache.in_flight.in_flight() == 0
+    # 之后的相同任务直接命中缓存
+    again = ViduTaskScheduler("test", poller=make_poller(), cache=cache)
+    again.submit_text2audio(0, PROMPT, duration=2)
+    assert again.run()[0][TASK_AUDIO] is not None
+    assert len(vidu_tasks(fake_vidu, "audio")) == 1
+
+
+def test_joined_task_receives_leader_error(fake_vidu, make_poller, cache):
+    key = audio_cache_key(text2audio_payload(PROMPT, duration=2))
+    cache.in_flight.begin(key)
+    scheduler = ViduTaskScheduler("test", poller=make_poller(), cache=cache)
+    scheduler.submit_text2audio(0, PROMPT, duration=2)
+    completed = []
+    threading.Timer(0.1, lambda: cache.in_flight.finish(key, error=Exception("上游生成失败"))).start()
+
+    results = scheduler.run(on_scene_complete=lambda idx, result: completed.append(idx))
+
+    assert results[0]["errors"] == {TASK_AUDIO: "上游生成失败"}
+    assert completed == [0]
+    assert vidu_tasks(fake_vidu, "audio") == []
+
+
+def test_joined_task_times_out_at_deadline(make_poller, cache):
+    key = audio_cache_key(text2audio_payload(PROMPT, duration=2))
+    cache.in_flight.begin(key)
+    scheduler = ViduTaskScheduler("test", poller=make_poller(deadline=0.2), cache=cache)
+    scheduler.submit_text2audio(0, PROMPT, duration=2)
+
+    results = scheduler.run()
+
+    assert "轮询超时" in results[0]["errors"][TASK_AUDIO]
+    assert scheduler.joined == {}
+    cache.in_flight.finish(key, "done")
+
+
+def test_leader_timeout_releases_joiners(fake_vidu, make_poller, cache):
+    # 任务需要 0.5 秒，发起者 0.2 秒就超时；等待它的调用方收到同一个错误，不会一直挂起
+    leader = ViduTaskScheduler("test", poller=make_poller(deadline=0.2), cache=cache)
+    joiner = ViduTaskScheduler("test", poller=make_poller(), cache=cache)
+    leader.submit_text2audio(0, PROMPT, duration=2)
+    joiner.submit_text2audio(0, PROMPT, duration=2)
+
+    leader_results, joiner_results = run_all(leader, joiner)
+
+    assert "轮询超时" in leader_results[0]["errors"][TASK_AUDIO]
+    assert "轮询超时" in joiner_results[0]["errors"][TASK_AUDIO]
+    assert cache.in_flight.in_flight() == 0
+
+
+def test_bad_result_fails_only_that_task(fake_vidu, make_poller):
+    poller = make_poller()
+    scheduler = ViduTaskScheduler("test", poller=poller)
+    broken = scheduler.submit_text2audio(0, PROMPT, duration=2)
+    scheduler.submit_text2audio(1, "另一个场景", duration=2)
+    fetch = poller.fetch
+
+    def fetch_without_creations(task_id):
+        poll_json = fetch(task_id)
+        if task_id == broken:
+            poll_json.pop("creations", None)
+        return poll_json
+
+    poller.fetch = fetch_without_creations
+    results = scheduler.run()
+
+    assert results[0][TASK_AUDIO] is None
+    assert "没有返回生成结果" in results[0]["errors"][TASK_AUDIO]
+    assert results[1][TASK_AUDIO] is not None and results[1]["errors"] == {}
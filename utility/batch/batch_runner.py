@@ -0,0 +1,233 @@
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utility.audio.audio_generator import generate_audio
+from utility.cache.asset_cache import get_asset_cache
+from utility.image.batch_generator import build_image_prompt, generate_images_concurrently
+from utility.image.image_generator import generate_single_caption_image
+from utility.render.video_merger import merge_videos_and_audios
+from utility.script.script_generator import generate_script, split_sentences
+from utility.vidu.task_scheduler import audio_duration_for, build_audio_prompt
+from utility.video.video_generator import generate_video
+
+DEFAULT_STYLE = "宫崎骏风格"
+# 各服务商同时进行中的请求/任务上限（所有作业共享）；render 为同时合成的视频数
+DEFAULT_LIMITS = {
+    "deepseek": 2,
+    "dashscope": 2,
+    "vidu": 4,
+    "render": 1,
+}
+CHECKPOINT_FILE = "checkpoint.json"
+MANIFEST_FILE = "manifest.json"
+
+
+def parse_language(value):
+    """中文 / zh / 1 -> 1，其余视为英文 -> 0（与 generate_script 的 language 参数一致）。"""
+    return 1 if str(value).strip().lower() in ("中文", "zh", "chinese", "1") else 0
+
+
+def load_jobs(path):
+    """
+    读取作业列表：.csv（表头 topic,language,style）或 .jsonl（每行一个对象），
+    也支持每行一个主题的纯文本文件。language 缺省为中文，style 缺省为 DEFAULT_STYLE。
+    """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        elif path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = [{"topic": line.strip()} for line in f if line.strip()]
+
+    jobs = []
+    for row in rows:
+        topic = (row.get("topic") or "").strip()
+        if not topic:
+            continue
+        jobs.append({
+            "topic": topic,
+            "language": parse_language(row.get("language") or "中文"),
+            "style": (row.get("style") or "").strip() or DEFAULT_STYLE,
+        })
+    return jobs
+
+
+def job_id(job):
+    key = json.dumps([job["topic"], job["language"], job["style"]], ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def resolve_ref(ref):
+    """
+    checkpoint 中保存的是生成时服务商返回的 URL，过了有效期就无法下载；
+    通过资源缓存换成仍在有效期内的 URL 或本地文件，缓存中没有时原样返回。
+    """
+    cache = get_asset_cache()
+    key = cache.key_for_ref(ref) if ref else None
+    return (cache.get(key) if key else None) or ref
+
+
+class Checkpoint:
+    """以作业 ID 为键保存每个作业已完成的步骤，中断后重新运行时从断点继续。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    def get(self, jid):
+        with self._lock:
+            return json.loads(json.dumps(self.data.get(jid, {})))
+
+    def save(self, jid, state):
+        with self._lock:
+            self.data[jid] = state
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class BatchRunner:
+    """
+    批量生成校园短视频：剧本 → 切分场景 → 图片 → 视频片段 + 背景音 → 合成。
+
+    作业在线程池中并行执行，各服务商的并发上限由全局信号量控制；每完成一步写入
+    checkpoint，每个作业在输出目录下生成 manifest.json 和 final_video.mp4。
+    """
+
+    def __init__(self, out_dir, limits=None, max_jobs=2, log=print):
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        self.limits = {name: threading.BoundedSemaphore(n) for name, n in {**DEFAULT_LIMITS, **(limits or {})}.items()}
+        self.max_jobs = max_jobs
+        self.log = log
+        self.checkpoint = Checkpoint(os.path.join(out_dir, CHECKPOINT_FILE))
+
+    def _limited(self, provider, fn):
+        def wrapper(*args, **kwargs):
+            with self.limits[provider]:
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def run(self, jobs):
+        """运行所有作业，返回每个作业的 manifest（按输入顺序）。"""
+        manifests = [None] * len(jobs)
+        with ThreadPoolExecutor(max_workers=self.max_jobs) as executor:
+            futures = {executor.submit(self.run_job, job): i for i, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                manifests[futures[future]] = future.result()
+        return manifests
+
+    def run_job(self, job):
+        jid = job_id(job)
+        job_dir = os.path.join(self.out_dir, jid)
+        os.makedirs(job_dir, exist_ok=True)
+        state = self.checkpoint.get(jid) or {**job, "status": "pending", "timings": {}}
+        if state.get("status") == "done":
+            self.log(f"[{jid}] 已完成，跳过：{job['topic']}")
+            return self._write_manifest(job_dir, state)
+
+        state["error"] = None
+        try:
+            self._run_steps(jid, job, job_dir, state)
+            state["status"] = "done"
+        except Exception as e:
+            state["status"] = "failed"
+            state["error"] = f"{e}\n{traceback.format_exc()}"
+            self.log(f"[{jid}] 失败：{e}")
+        self.checkpoint.save(jid, state)
+        return self._write_manifest(job_dir, state)
+
+    def _step(self, jid, state, name, fn):
+        start = time.perf_counter()
+        fn()
+        state["timings"][name] = state["timings"].get(name, 0) + time.perf_counter() - start
+        self.checkpoint.save(jid, state)
+        self.log(f"[{jid}] {name} 完成（{state['timings'][name]:.1f} s）")
+
+    def _run_steps(self, jid, job, job_dir, state):
+        topic, language, style = job["topic"], job["language"], job["style"]
+
+        if not state.get("script"):
+            def script_step():
+                state["script"] = self._limited("deepseek", generate_script)(topic, language)
+                state["scenes"] = [{"text": text} for text in split_sentences(state["script"], language)]
+            self._step(jid, state, "script", script_step)
+        scenes = state["scenes"]
+        if not scenes:
+            raise Exception("剧本切分后没有场景")
+
+        missing = [i for i, scene in enumerate(scenes) if not scene.get("image")]
+        if missing:
+            def image_step():
+                prompts = [build_image_prompt(scenes[i]["text"], scenes[i - 1]["text"] if i > 0 else None)
+                           for i in missing]
+                urls, errors = generate_images_concurrently(
+                    self._limited("dashscope", generate_single_caption_image), style, prompts)
+                for i, url, error in zip(missing, urls, errors):
+                    scenes[i]["image"] = url
+                    scenes[i]["image_error"] = str(error) if error else None
+            self._step(jid, state, "images", image_step)
+        failed = [i + 1 for i, scene in enumerate(scenes) if not scene.get("image")]
+        if failed:
+            raise Exception(f"场景 {failed} 图片生成失败")
+
+        clip_jobs = [(i, kind) for i, scene in enumerate(scenes) for kind in ("video", "audio") if not scene.get(kind)]
+        if clip_jobs:
+            self._step(jid, state, "clips", lambda: self._generate_clips(jid, state, clip_jobs))
+        failed = [i + 1 for i, scene in enumerate(scenes) if not (scene.get("video") and scene.get("audio"))]
+        if failed:
+            raise Exception(f"场景 {failed} 视频/背景音生成失败")
+
+        if not state.get("output") or not os.path.exists(state["output"]):
+            def render_step():
+                output_path = os.path.join(job_dir, "final_video.mp4")
+                # 断点续跑时 URL 可能已经过期，改用缓存中的文件
+                self._limited("render", merge_videos_and_audios)(
+                    [resolve_ref(scene["video"]) for scene in scenes],
+                    [resolve_ref(scene["audio"]) for scene in scenes],
+                    [scene["text"] for scene in scenes],
+                    output_path=output_path)
+                state["output"] = output_path
+            self._step(jid, state, "render", render_step)
+
+    def _generate_clips(self, jid, state, clip_jobs):
+        scenes = state["scenes"]
+
+        def run_clip(i, kind):
+            text = scenes[i]["text"]
+            if kind == "video":
+                return self._limited("vidu", generate_video)(scenes[i]["image"], text)
+            duration = audio_duration_for(resolve_ref(scenes[i].get("video")))
+            return self._limited("vidu", generate_audio)(build_audio_prompt(text), duration=duration)
+
+        with ThreadPoolExecutor(max_workers=len(clip_jobs)) as executor:
+            futures = {executor.submit(run_clip, i, kind): (i, kind) for i, kind in clip_jobs}
+            for future in as_completed(futures):
+                i, kind = futures[future]
+                try:
+                    scenes[i][kind] = future.result()
+                    scenes[i][f"{kind}_error"] = None
+                except Exception as e:
+                    scenes[i][f"{kind}_error"] = str(e)
+                # 每完成一个片段就写一次 checkpoint，中断后不必重新生成
+                self.checkpoint.save(jid, state)
+
+    def _write_manifest(self, job_dir, state):
+        manifest = {**state, "job_id": os.path.basename(job_dir), "updated_at": time.time()}
+        with open(os.path.join(job_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return manifest
@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from utility.cache.single_flight import SingleFlight
+from utility.network import http_client
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，索引只在进程内加锁
+    fcntl = None
+
+# 缓存根目录与总大小上限（字节），可通过环境变量覆盖
+CACHE_DIR = os.getenv("ASSET_CACHE_DIR", ".asset_cache")
+MAX_BYTES = int(os.getenv("ASSET_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# 服务商返回的资源 URL 有效期较短（DashScope 约 24 小时），过期后改用本地文件
+URL_TTL = 12 * 3600
+INDEX_FILE = "index.json"
+
+
+def make_key(kind, **params):
+    """根据资源类型和生成参数（模型、prompt、风格、seed、尺寸/时长等）计算缓存键。"""
+    payload = json.dumps({"kind": kind, **params}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_local_ref(ref):
+    """判断资源引用是本地文件路径还是远程 URL。"""
+    return urlparse(str(ref)).scheme not in ("http", "https")
+
+
+class AssetCache:
+    """
+    按生成参数做内容寻址的本地资源缓存（图片、视频片段、音频）。
+
+    文件保存在 root/<key 前两位>/<key><扩展名>，index.json 记录每个条目的来源 URL、
+    大小和最近访问时间；总大小超过 max_bytes 时按最近最少使用淘汰。
+    命中只更新内存中的访问时间；写入和淘汰时在文件锁内重新读取 index.json 合并后再保存，
+    页面和批量命令行等多个进程共用同一缓存目录时不会互相覆盖对方的条目。
+    in_flight 记录正在生成、尚未写入缓存的键，相同参数的并发请求只生成一次。
+    pin() 的条目在 unpin() 之前不会被淘汰（如正在合成的视频所用的片段）。
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES, url_ttl=URL_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.url_ttl = url_ttl
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._index_path = os.path.join(self.root, INDEX_FILE)
+        self._index = self._load_index()
+        # 来源 URL / 本地路径 -> 键，供 key_for_ref 反查
+        self._refs = {}
+        self._index_refs()
+        # 本进程发现文件已丢失、下次保存时要从索引中去掉的键
+        self._removed = set()
+        self.in_flight = SingleFlight()
+        # 键 -> 固定次数，同一条目可能同时被多次合成使用
+        self._pinned = Counter()
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _index_refs(self):
+        self._refs = {}
+        for key, entry in self._index.items():
+            if entry.get("url"):
+                self._refs[entry["url"]] = key
+            self._refs[os.path.join(self.root, entry["path"])] = key
+
+    @contextmanager
+    def _index_file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self._index_path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _save_index(self, added=None):
+        """
+        调用方持有 self._lock。在文件锁内以磁盘上的索引为准合并本进程的访问时间，
+        加入 added 中的新条目并淘汰到预算以内，然后保存。
+        只在内存里、磁盘上已没有的条目是被其他进程淘汰的，随之丢弃。
+        """
+        with self._index_file_lock():
+            index = self._load_index()
+            for key in self._removed:
+                index.pop(key, None)
+            for key, entry in index.items():
+                mine = self._index.get(key)
+                if mine is not None:
+                    entry["last_access"] = max(entry["last_access"], mine["last_access"])
+            self._index = index
+            self._index.update(added or {})
+            self._evict()
+            tmp_path = f"{self._index_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._index, f, ensure_ascii=False)
+            os.replace(tmp_path, self._index_path)
+        self._removed.clear()
+        self._index_refs()
+
+    def _file_path(self, key, ext):
+        return os.path.join(self.root, key[:2], f"{key}{ext}")
+
+    def total_size(self):
+        return sum(entry["size"] for entry in self._index.values())
+
+    def get(self, key):
+        """
+        查询缓存，命中时返回可直接使用的资源引用：
+        来源 URL 仍在有效期内时返回该 URL，否则返回本地文件路径；未命中返回 None。
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            path = os.path.join(self.root, entry["path"])
+            if not os.path.exists(path):
+                self._forget(key)
+                return None
+            entry["last_access"] = time.time()
+            if entry.get("url") and time.time() - entry["created"] < self.url_ttl:
+                return entry["url"]
+            return path
+
+    def get_path(self, key):
+        """返回缓存条目的本地文件路径，未命中返回 None。"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            path = os.path.join(self.root, entry["path"])
+            if not os.path.exists(path):
+                self._forget(key)
+                return None
+            entry["last_access"] = time.time()
+            return path
+
+    def _forget(self, key):
+        # 文件已被删除（其他进程淘汰或手动清理），下次保存索引时一并去掉
+        entry = self._index.pop(key)
+        self._removed.add(key)
+        self._refs.pop(entry.get("url"), None)
+        self._refs.pop(os.path.join(self.root, entry["path"]), None)
+
+    def key_for_ref(self, ref):
+        """根据缓存返回过的 URL 或本地路径反查缓存键，用于把上游资源作为下游缓存键的一部分。"""
+        with self._lock:
+            return self._refs.get(ref)
+
+    def pin(self, key):
+        """固定条目（可以在写入缓存之前调用），直到对应的 unpin() 之前不会被淘汰。"""
+        with self._lock:
+            self._pinned[key] += 1
+
+    def unpin(self, key):
+        """取消一次固定；固定期间超出的预算在这里补做淘汰。"""
+        with self._lock:
+            self._pinned[key] -= 1
+            if self._pinned[key] <= 0:
+                del self._pinned[key]
+            if self.total_size() > self.max_bytes:
+                self._save_index()
+
+    def put_url(self, key, url, ext=None):
+        """下载远程资源写入缓存，返回本地文件路径。"""
+        if ext is None:
+            ext = os.path.splitext(urlparse(url).path)[-1]
+        path = self._file_path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            r = http_client.get(url, stream=True)
+            r.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            # 下载中途失败时不留下残缺的临时文件
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._add_entry(key, path, url)
+        return path
+
+    def put_file(self, key, src_path):
+        """把本地生成的文件移动到缓存中，返回缓存内的文件路径。"""
+        path = self._file_path(key, os.path.splitext(src_path)[-1])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(src_path, path)
+        self._add_entry(key, path, None)
+        return path
+
+    def _add_entry(self, key, path, url):
+        now = time.time()
+        entry = {
+            "path": os.path.relpath(path, self.root),
+            "url": url,
+            "size": os.path.getsize(path),
+            "created": now,
+            "last_access": now,
+        }
+        with self._lock:
+            self._removed.discard(key)
+            self._save_index(added={key: entry})
+
+    def _evict(self):
+        total = self.total_size()
+        # 按最近访问时间从旧到新淘汰，直到总大小回到预算以内；跳过被固定的条目
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            try:
+                os.remove(os.path.join(self.root, entry["path"]))
+            except OSError:
+                pass
+            total -= entry["size"]
+            del self._index[key]
+
+    def get_or_create(self, key, generate_fn, ext=None, kind="asset", on_join=None, timeout=None):
+        """
+        命中缓存直接返回资源引用；否则调用 generate_fn() 得到远程 URL，
+        下载到缓存后返回该 URL（下载或写入缓存失败时只打印日志，仍返回该 URL）。
+
+        同一键已在生成时不再调用 generate_fn()，而是等待那次生成的结果（见 SingleFlight.do）。
+        """
+        ref = self.get(key)
+        if ref is not None:
+            return ref
+
+        def create():
+            # 上一个发起者可能刚刚写入缓存
+            ref = self.get(key)
+            if ref is not None:
+                return ref
+            url = generate_fn()
+            try:
+                self.put_url(key, url, ext=ext)
+            except Exception as e:
+                # 生成已经付费完成，缓存写入失败时仍返回生成的 URL，避免调用方重新生成
+                print(f"[缓存写入失败] {key}: {e}")
+            return url
+
+        return self.in_flight.do(key, create, kind=kind, on_join=on_join, timeout=timeout)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_asset_cache():
+    """进程内共享的缓存实例，多个 Streamlit 会话共用同一份索引。"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AssetCache()
+        return _default_cache
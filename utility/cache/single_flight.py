@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import Future
+
+from utility.metrics import tracer
+
+
+class SingleFlight:
+    """
+    合并同一键上正在进行的生成请求。
+
+    第一个调用方（发起者）真正执行生成，之后到达的相同键调用方拿到同一个 Future，
+    等待发起者的结果，不再重复提交；发起者失败时等待者收到同一个异常。
+    生成结束后键即被移除，之后的调用应该直接命中缓存。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 键 -> Future
+        self._calls = {}
+
+    def begin(self, key):
+        """返回 (future, 是否为发起者)；发起者必须在结束后调用 finish()。"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def finish(self, key, result=None, error=None):
+        """发起者结束生成：唤醒所有等待同一键的调用方。"""
+        with self._lock:
+            future = self._calls.pop(key, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, kind="asset", on_join=None, timeout=None):
+        """
+        同一键同时只执行一次 fn()，并发的相同调用共享其返回值。
+
+        on_join() 在加入已有生成时回调；timeout 为等待发起者的最长秒数，超时抛出 TimeoutError。
+        """
+        future, leader = self.begin(key)
+        if not leader:
+            tracer.add("single_flight_joined", kind=kind)
+            if on_join is not None:
+                on_join()
+            return future.result(timeout)
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, result)
+        return result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
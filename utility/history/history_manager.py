@@ -1,47 +1,135 @@
 import streamlit as st
-import base64
+import html
+import math
+import os
 from datetime import datetime
 from pathlib import Path
 
+from utility.history.history_store import (ASSET_AUDIO, ASSET_FINAL, ASSET_IMAGE, ASSET_OTHER, ASSET_VIDEO,
+                                           get_history_store)
+from utility.storage.artifact_store import get_artifact_store
+
+# 侧边栏每页展示的记录数
+PAGE_SIZE = 10
+# 侧边栏筛选项 -> 资源类型
+TYPE_FILTERS = {
+    "全部": None,
+    "🖼️ 图片": ASSET_IMAGE,
+    "🎞️ 视频": ASSET_VIDEO,
+    "🎵 音频": ASSET_AUDIO,
+    "🎬 合成视频": ASSET_FINAL,
+}
+
+
+def _guess_asset_type(label, is_file):
+    if is_file:
+        return ASSET_FINAL
+    for keyword, asset_type in (("图片", ASSET_IMAGE), ("视频", ASSET_VIDEO), ("音频", ASSET_AUDIO)):
+        if keyword in label:
+            return asset_type
+    return ASSET_OTHER
+
+
 class SimpleHistory:
+    """
+    生成历史：记录写入 SQLite（见 history_store），刷新页面后仍然保留；
+    session_state 中只保存当前这次生成的 run_id。
+    """
+
     def __init__(self, key="simple_history"):
         self.key = key
-        if self.key not in st.session_state:
-            st.session_state[self.key] = []
+        self.store = get_history_store()
+        st.session_state.setdefault(f"{self.key}_run_id", None)
+
+    @property
+    def run_id(self):
+        return st.session_state[f"{self.key}_run_id"]
 
-    def add_record(self, url_or_path_or_bytes, label="📥 下载资源", is_file=False, filename="resource"):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def start_run(self, topic, language=None, style=None, session_id=None):
+        """开始一次新的生成，之后添加的记录都归到这次生成下。"""
+        st.session_state[f"{self.key}_run_id"] = self.store.start_run(topic, language=language, style=style,
+                                                                      session_id=session_id)
+        return self.run_id
+
+    def add_record(self, url_or_path_or_bytes, label="📥 下载资源", is_file=False, filename="resource",
+                   asset_type=None, **fields):
+        """
+        添加一条历史记录。fields 可附带 scene / prompt / style / duration_ms / cost，
+        用于之后按条件检索和复用。
+        """
+        asset_type = asset_type or _guess_asset_type(label, is_file)
 
         if is_file:  # 如果是本地文件路径或二进制内容
             if isinstance(url_or_path_or_bytes, (str, Path)):
-                with open(url_or_path_or_bytes, "rb") as f:
-                    data = f.read()
+                source = str(url_or_path_or_bytes)
+                ext = os.path.splitext(source)[-1]
             elif isinstance(url_or_path_or_bytes, bytes):
-                data = url_or_path_or_bytes
+                source = url_or_path_or_bytes
+                ext = ""
             else:
-                raise TypeError("Unsupported file input type for base64 download")
+                raise TypeError("Unsupported file input type for artifact download")
 
-            b64 = base64.b64encode(data).decode()
-            ext = ".mp4" if "视频" in label else ".bin"
-            url = f'data:application/octet-stream;base64,{b64}'
-            download_link = f'<a href="{url}" download="{filename}{ext}">{label}</a>'
+            if not ext:
+                ext = ".mp4" if "视频" in label else ".bin"
+            # 文件存入产物仓库，历史记录里只保留产物 ID，下载时再从磁盘流式读取
+            artifact_id = get_artifact_store().add(source, f"{filename}{ext}")
+            self.store.add_asset(asset_type, run_id=self.run_id, label=label, artifact_id=artifact_id, **fields)
         else:
-            # 普通 URL
-            download_link = f'<a href="{url_or_path_or_bytes}" target="_blank">{label}</a>'
+            # 普通 URL（或缓存中的本地路径）
+            self.store.add_asset(asset_type, run_id=self.run_id, label=label, url=str(url_or_path_or_bytes), **fields)
+
+    def background_recorder(self):
+        """
+        返回可在后台线程中调用的 add(url, label, asset_type=None, **fields)，
+        记录归到当前这次生成下（后台线程不能访问 session_state）。
+        Vidu 生成的视频 / 音频自动附带任务耗时和消耗的积分。
+        """
+        run_id, store = self.run_id, self.store
+
+        def add(url, label, asset_type=None, **fields):
+            # 只在后台任务里用到，不随页面首次导入加载 requests 等依赖
+            from utility.vidu.poller import get_vidu_poller
 
-        st.session_state[self.key].append((timestamp, download_link))
+            fields = {**get_vidu_poller().usage(str(url)), **fields}
+            store.add_asset(asset_type or _guess_asset_type(label, False), run_id=run_id, label=label, url=str(url),
+                            **fields)
+        return add
 
-    def render(self):
+    def _link(self, record):
+        # 标签、文件名和 URL 来自用户输入或接口返回，拼进 HTML 前统一转义
+        label = html.escape(record["label"] or "")
+        if record["artifact_id"]:
+            meta = get_artifact_store().get(record["artifact_id"])
+            if meta is None:
+                return f"{label}（文件已清理）"
+            return f'<a href="{html.escape(get_artifact_store().url(record["artifact_id"]))}" ' \
+                   f'download="{html.escape(meta["filename"])}">{label}</a>'
+        return f'<a href="{html.escape(record["url"] or "")}" target="_blank">{label}</a>'
+
+    def render(self, session_id=None):
+        """在侧边栏分页展示历史记录；指定 session_id 时只展示该会话的记录。"""
         st.sidebar.markdown("## 🕘 历史记录")
-        for entry in reversed(st.session_state[self.key]):
-            if len(entry) == 2:
-                ts, link_html = entry
-                st.sidebar.markdown(f"### {ts}")
-                st.sidebar.markdown(link_html, unsafe_allow_html=True)
-            elif len(entry) == 3:
-                ts, url, label = entry
-                st.sidebar.markdown(f"### {ts}")
-                st.sidebar.markdown(f"[{label}]({url})", unsafe_allow_html=True)
-            else:
-                st.sidebar.warning("⚠️ 历史记录格式错误")
+        type_label = st.sidebar.selectbox("类型", list(TYPE_FILTERS), key=f"{self.key}_type")
+        keyword = st.sidebar.text_input("🔍 搜索主题 / 标签 / prompt", key=f"{self.key}_keyword").strip()
+        filters = {"asset_type": TYPE_FILTERS[type_label], "keyword": keyword or None, "session_id": session_id}
+
+        total = self.store.count_assets(**filters)
+        if total == 0:
+            st.sidebar.caption("暂无记录")
+            return
+        pages = math.ceil(total / PAGE_SIZE)
+        page = st.sidebar.number_input(f"页码（共 {pages} 页，{total} 条）", min_value=1, max_value=pages, value=1,
+                                       key=f"{self.key}_page")
 
+        for record in self.store.list_assets(limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE, **filters):
+            ts = datetime.fromtimestamp(record["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
+            topic = f" · {html.escape(record['topic'])}" if record["topic"] else ""
+            st.sidebar.markdown(f"### {ts}{topic}")
+            st.sidebar.markdown(self._link(record), unsafe_allow_html=True)
+            usage = []
+            if record["duration_ms"] is not None:
+                usage.append(f"耗时 {record['duration_ms'] / 1000:.1f} 秒")
+            if record["cost"] is not None:
+                usage.append(f"消耗 {record['cost']:g} 积分")
+            if usage:
+                st.sidebar.caption(" · ".join(usage))
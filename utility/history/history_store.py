@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import threading
+import time
+
+# 历史记录数据库路径
+HISTORY_DB = os.getenv("HISTORY_DB", "history.db")
+
+# 资源类型
+ASSET_IMAGE = "image"
+ASSET_VIDEO = "video"
+ASSET_AUDIO = "audio"
+ASSET_FINAL = "final"
+ASSET_OTHER = "other"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    language TEXT,
+    style TEXT,
+    session_id TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER REFERENCES runs(id),
+    scene INTEGER,
+    asset_type TEXT NOT NULL,
+    label TEXT,
+    url TEXT,
+    path TEXT,
+    artifact_id TEXT,
+    prompt TEXT,
+    style TEXT,
+    duration_ms REAL,
+    cost REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_topic ON runs(topic);
+CREATE INDEX IF NOT EXISTS idx_assets_created ON assets(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_assets_type_created ON assets(asset_type, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_assets_run_scene ON assets(run_id, scene);
+DROP INDEX IF EXISTS idx_assets_type_prompt;
+"""
+
+_ASSET_COLUMNS = ("run_id", "scene", "asset_type", "label", "url", "path", "artifact_id", "prompt", "style",
+                  "duration_ms", "cost")
+
+
+class HistoryStore:
+    """
+    基于 SQLite 的持久化生成历史：runs 记录每次生成（主题、语言、风格），
+    assets 记录每个场景生成的图片/视频/音频/合成视频及其 prompt、耗时和费用（Vidu 积分）。
+    查询都走索引并分页，几千次生成也不会拖慢页面；相同参数的资源由 AssetCache 按生成参数复用。
+    """
+
+    def __init__(self, db_path=HISTORY_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            # WAL 模式下读写互不阻塞，多个会话可以同时查看和写入历史
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def start_run(self, topic, language=None, style=None, session_id=None):
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO runs (topic, language, style, session_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                (topic, language, style, session_id, time.time()))
+            return cur.lastrowid
+
+    def add_asset(self, asset_type, **fields):
+        unknown = set(fields) - set(_ASSET_COLUMNS)
+        if unknown:
+            raise ValueError(f"未知的历史记录字段：{', '.join(sorted(unknown))}")
+        fields["asset_type"] = asset_type
+        columns = list(fields) + ["created_at"]
+        values = list(fields.values()) + [time.time()]
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                f"INSERT INTO assets ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})", values)
+            return cur.lastrowid
+
+    def _where(self, asset_type=None, keyword=None, run_id=None, topic=None, session_id=None):
+        clauses, params = [], []
+        if asset_type:
+            clauses.append("a.asset_type = ?")
+            params.append(asset_type)
+        if run_id is not None:
+            clauses.append("a.run_id = ?")
+            params.append(run_id)
+        if topic:
+            clauses.append("r.topic = ?")
+            params.append(topic)
+        if session_id is not None:
+            clauses.append("r.session_id = ?")
+            params.append(session_id)
+        if keyword:
+            clauses.append("(a.label LIKE ? OR a.prompt LIKE ? OR r.topic LIKE ?)")
+            params.extend([f"%{keyword}%"] * 3)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def list_assets(self, limit=20, offset=0, **filters):
+        """按时间倒序分页查询资源，filters 支持 asset_type / keyword / run_id / topic / session_id。"""
+        where, params = self._where(**filters)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT a.*, r.topic AS topic FROM assets a LEFT JOIN runs r ON a.run_id = r.id"
+                f"{where} ORDER BY a.created_at DESC LIMIT ? OFFSET ?", params + [limit, offset]).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_assets(self, **filters):
+        where, params = self._where(**filters)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM assets a LEFT JOIN runs r ON a.run_id = r.id{where}", params).fetchone()[0]
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """进程内共享的历史数据库连接。"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = HistoryStore()
+        return _default_store
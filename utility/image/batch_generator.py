@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 同时向 DashScope 提交的最大请求数，避免一次性打满接口配额
+DEFAULT_MAX_WORKERS = 5
+# 单个场景失败后的最大重试次数
+DEFAULT_RETRIES = 2
+# 重试前的等待秒数（按重试次数线性增长）
+DEFAULT_RETRY_DELAY = 1.0
+
+
+def build_image_prompt(text, prev_text=None):
+    # 带上前一句作为上下文，保持相邻场景画面连贯
+    if prev_text:
+        return f"在“{prev_text}”的前提下，你接下来根据“{text}”生成图片"
+    return text
+
+
+def _generate_with_retry(generate_fn, style, prompt, retries, retry_delay):
+    last_error = None
+    for attempt in range(retries + 1):
+        try:
+            return generate_fn(style, prompt)
+        except Exception as e:
+            last_error = e
+            if attempt < retries:
+                time.sleep(retry_delay * (attempt + 1))
+    raise last_error
+
+
+def generate_images_concurrently(generate_fn, style, prompts, max_workers=DEFAULT_MAX_WORKERS,
+                                 retries=DEFAULT_RETRIES, retry_delay=DEFAULT_RETRY_DELAY, on_progress=None):
+    """
+    并发生成所有场景图片，返回值按场景顺序排列。
+
+    generate_fn(style, prompt) 负责单张图片的生成并返回 URL；每个场景失败后会单独重试，
+    不影响其他场景。on_progress(done, total, idx, error) 在调用方线程中回调，
+    因此可以直接在其中更新 st.progress。
+
+    返回 (urls, errors)，失败场景对应的 url 为 None，error 为最后一次异常。
+    """
+    total = len(prompts)
+    urls = [None] * total
+    errors = [None] * total
+    if total == 0:
+        return urls, errors
+
+    workers = max(1, min(max_workers, total))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_generate_with_retry, generate_fn, style, prompt, retries, retry_delay): idx
+            for idx, prompt in enumerate(prompts)
+        }
+        done = 0
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                urls[idx] = future.result()
+            except Exception as e:
+                errors[idx] = e
+            done += 1
+            if on_progress is not None:
+                on_progress(done, total, idx, errors[idx])
+
+    return urls, errors
@@ -0,0 +1,42 @@
+import os
+from http import HTTPStatus
+
+from dashscope import ImageSynthesis
+
+from utility.cache.asset_cache import get_asset_cache, make_key
+from utility.metrics import tracer
+from utility.network.rate_limiter import call_limited
+
+IMAGE_MODEL = "wanx2.1-t2i-turbo"
+IMAGE_SIZE = "1024*1024"
+
+
+# 图像生成
+def generate_single_caption_image(style, txt):
+    prompt = f"{style} 风格，{style} 风格，描绘{txt}场景"
+    cache_key = make_key("image", model=IMAGE_MODEL, prompt=prompt, style=style, size=IMAGE_SIZE)
+
+    def call_dashscope():
+        with tracer.span("dashscope.image", model=IMAGE_MODEL):
+            # 所有会话共用 DashScope 的速率配额，被限流时放慢重试而不是直接判定失败
+            rsp = call_limited(
+                "dashscope",
+                lambda: ImageSynthesis.call(
+                    api_key=os.getenv("DASHSCOPE_API_KEY"),
+                    model=IMAGE_MODEL,
+                    prompt=prompt,
+                    n=1,
+                    size=IMAGE_SIZE
+                ),
+                model=IMAGE_MODEL,
+                is_throttled=lambda rsp: rsp.status_code == HTTPStatus.TOO_MANY_REQUESTS or
+                                         str(rsp.code or "").startswith("Throttling"),
+                retry_after=lambda rsp: None,
+            )
+            if rsp.status_code != HTTPStatus.OK:
+                raise Exception(f"图像生成失败: {rsp.status_code}, code: {rsp.code}, message: {rsp.message}")
+        tracer.add("dashscope_images", 1, model=IMAGE_MODEL)
+        return rsp.output.results[0].url
+
+    # 相同参数的图片直接复用缓存，不再消耗 API 额度；正在生成时等待同一次生成的结果
+    return get_asset_cache().get_or_create(cache_key, call_dashscope, kind="image")
@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# 任务表数据库路径
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+# 同时执行的后台任务数
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+# 进程重启前还没执行完的任务
+JOB_INTERRUPTED = "interrupted"
+
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    scene INTEGER,
+    label TEXT,
+    status TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_seq INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_session_created ON jobs(session_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+"""
+
+# 任务结束时在写事务内分配的递增序号，页面按它增量读取结束的任务；
+# 与时间戳不同，序号的先后与提交顺序一致，先取时间戳、后提交的任务不会被跳过
+_NEXT_FINISHED_SEQ = "(SELECT COALESCE(MAX(finished_seq), 0) + 1 FROM jobs)"
+
+
+class JobRunner:
+    """
+    后台任务执行器：Vidu / DashScope 等耗时生成在工作线程中运行，不占用 Streamlit 的脚本线程。
+
+    任务状态、进度和结果写入本地 SQLite 任务表，页面每次运行只读取任务表；
+    执行器在进程内共享，因此页面重新运行、刷新浏览器后任务仍继续执行，按 session_id 找回。
+    """
+
+    def __init__(self, db_path=JOBS_DB, max_workers=JOB_WORKERS):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            # 旧版本创建的任务表没有 finished_seq 列
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "finished_seq" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN finished_seq INTEGER")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_session_finished ON jobs(session_id, finished_seq)")
+            # 上一个进程留下的未完成任务已经没有线程在执行
+            self._conn.execute(
+                f"UPDATE jobs SET status = ?, updated_at = ?, finished_seq = {_NEXT_FINISHED_SEQ} "
+                f"WHERE status IN ({', '.join('?' for _ in ACTIVE_STATES)})",
+                (JOB_INTERRUPTED, time.time(), *ACTIVE_STATES))
+
+    def _update(self, job_id, **fields):
+        assignments = [f"{k} = ?" for k in fields] + ["updated_at = ?"]
+        if "status" in fields and fields["status"] not in ACTIVE_STATES:
+            assignments.append(f"finished_seq = {_NEXT_FINISHED_SEQ}")
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE id = ?",
+                               (*fields.values(), time.time(), job_id))
+
+    def submit(self, session_id, kind, fn, scene=None, label=None, on_done=None):
+        """
+        提交一个后台任务，返回任务 ID。
+
+        fn(report) 在工作线程中执行，report(message) 用于更新任务进度，返回值（需可 JSON 序列化）作为任务结果；
+        on_done(result) 在任务成功后于工作线程中回调，可用于写入历史记录。
+        同一会话中相同 kind / scene 的任务还在执行时不会重复提交，直接返回已有任务的 ID。
+        """
+        active = self.find_active(session_id, kind, scene)
+        if active is not None:
+            return active["id"]
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, session_id, kind, scene, label, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, session_id, kind, scene, label, JOB_QUEUED, now, now))
+        self._executor.submit(self._run, job_id, fn, on_done)
+        return job_id
+
+    def _run(self, job_id, fn, on_done):
+        self._update(job_id, status=JOB_RUNNING)
+        try:
+            result = fn(lambda message: self._update(job_id, progress=str(message)))
+        except Exception as e:
+            print(f"[后台任务失败] {job_id}: {traceback.format_exc()}")
+            self._update(job_id, status=JOB_FAILED, error=str(e))
+            return
+        self._update(job_id, status=JOB_SUCCEEDED, result=json.dumps(result, ensure_ascii=False))
+        if on_done is not None:
+            try:
+                on_done(result)
+            except Exception as e:
+                print(f"[后台任务回调失败] {job_id}: {e}")
+
+    @staticmethod
+    def _decode(row):
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def find_active(self, session_id, kind, scene=None):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT * FROM jobs WHERE session_id = ? AND kind = ? AND scene IS ? "
+                f"AND status IN ({', '.join('?' for _ in ACTIVE_STATES)}) ORDER BY created_at DESC LIMIT 1",
+                (session_id, kind, scene, *ACTIVE_STATES)).fetchone()
+        return self._decode(row) if row else None
+
+    def list_jobs(self, session_id, limit=50):
+        """按提交时间倒序返回会话的任务。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE session_id = ? ORDER BY created_at DESC LIMIT ?",
+                (session_id, limit)).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def list_finished(self, session_id, after_seq=0):
+        """
+        按提交顺序返回会话中结束序号大于 after_seq 的任务，不受任务面板展示条数的限制。
+
+        调用方记录已读到的最大 finished_seq，下次从它之后继续读取。
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE session_id = ? AND finished_seq > ? ORDER BY created_at",
+                (session_id, after_seq)).fetchall()
+        return [self._decode(row) for row in rows]
+
+
+_default_runner = None
+_default_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    """进程内共享的后台任务执行器。"""
+    global _default_runner
+    with _default_runner_lock:
+        if _default_runner is None:
+            _default_runner = JobRunner()
+        return _default_runner
@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from utility.storage import file_server
+
+# span 记录追加写入的 JSON-lines 文件，设为空字符串时只在内存中统计
+METRICS_FILE = os.getenv("METRICS_FILE", "metrics.jsonl")
+# Prometheus 文本格式的指标地址：<文件服务地址>/metrics
+METRICS_ROUTE = "metrics"
+# 每类 span 保留最近多少次耗时用于计算分位数
+RECENT_SAMPLES = 1000
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def _labels(labels):
+    return ",".join(f'{k}="{str(v)}"' for k, v in sorted(labels.items()))
+
+
+class Tracer:
+    """
+    记录流水线各阶段 / 各场景的耗时（span）和累计计数（下载字节、API 额度等）。
+
+    每个 span 追加写入 METRICS_FILE 一行 JSON，同时在内存中按名称汇总，
+    供页面的统计面板和 Prometheus 文本格式的 /metrics 使用。
+    """
+
+    def __init__(self, path=METRICS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        # span 名称 -> {"count", "errors", "total_ms", "max_ms", "recent": deque}
+        self._spans = {}
+        # (计数器名称, 标签) -> 累计值
+        self._counters = {}
+
+    def record_span(self, name, duration_ms, status="ok", **attrs):
+        """记录一个已经测好耗时的 span（例如在子进程或轮询中测得的阶段耗时）。"""
+        record = {"name": name, "ts": time.time(), "duration_ms": round(duration_ms, 3), "status": status, **attrs}
+        with self._lock:
+            stats = self._spans.setdefault(name, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                                  "recent": deque(maxlen=RECENT_SAMPLES)})
+            stats["count"] += 1
+            stats["errors"] += status != "ok"
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["recent"].append(duration_ms)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        return record
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """
+        统计 with 块的耗时；块内可以往产出的 dict 里补充属性（如字节数、帧数）。
+        块内抛出异常时 span 记为 error 并继续抛出。
+        """
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield attrs
+        except Exception as e:
+            status = "error"
+            attrs["error"] = str(e)
+            raise
+        finally:
+            self.record_span(name, (time.perf_counter() - start) * 1000, status=status, **attrs)
+
+    def add(self, name, value=1, **labels):
+        """累加计数器，如 vidu_credits、dashscope_images、deepseek_tokens、download_bytes。"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def summary(self):
+        """按 span 名称汇总：次数、失败数、平均 / p50 / p95 / 最大耗时（毫秒）。"""
+        with self._lock:
+            items = [(name, dict(stats, recent=list(stats["recent"]))) for name, stats in self._spans.items()]
+        return [{
+            "name": name,
+            "count": stats["count"],
+            "errors": stats["errors"],
+            "avg_ms": round(stats["total_ms"] / stats["count"], 1),
+            "p50_ms": round(_percentile(stats["recent"], 0.5), 1),
+            "p95_ms": round(_percentile(stats["recent"], 0.95), 1),
+            "max_ms": round(stats["max_ms"], 1),
+        } for name, stats in sorted(items)]
+
+    def counters(self):
+        with self._lock:
+            return [{"name": name, **dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())]
+
+    def prometheus(self):
+        """Prometheus 文本格式（text/plain; version=0.0.4）的全部指标。"""
+        with self._lock:
+            spans = sorted(self._spans.items())
+            counters = sorted(self._counters.items())
+        lines = ["# TYPE t2v_span_duration_seconds summary"]
+        for name, stats in spans:
+            recent = list(stats["recent"])
+            for q in (0.5, 0.95):
+                lines.append(f't2v_span_duration_seconds{{span="{name}",quantile="{q}"}} '
+                             f'{_percentile(recent, q) / 1000:.6f}')
+            lines.append(f't2v_span_duration_seconds_sum{{span="{name}"}} {stats["total_ms"] / 1000:.6f}')
+            lines.append(f't2v_span_duration_seconds_count{{span="{name}"}} {stats["count"]}')
+        lines.append("# TYPE t2v_span_errors_total counter")
+        for name, stats in spans:
+            lines.append(f't2v_span_errors_total{{span="{name}"}} {stats["errors"]}')
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE t2v_{name}_total counter")
+            for (counter, labels), value in counters:
+                if counter == name:
+                    label_text = _labels(dict(labels))
+                    lines.append(f"t2v_{name}_total{{{label_text}}} {value}" if label_text else
+                                 f"t2v_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+_default_tracer = None
+_default_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """进程内共享的 tracer。"""
+    global _default_tracer
+    with _default_tracer_lock:
+        if _default_tracer is None:
+            _default_tracer = Tracer()
+        return _default_tracer
+
+
+def span(name, **attrs):
+    return get_tracer().span(name, **attrs)
+
+
+def record_span(name, duration_ms, status="ok", **attrs):
+    return get_tracer().record_span(name, duration_ms, status=status, **attrs)
+
+
+def add(name, value=1, **labels):
+    get_tracer().add(name, value, **labels)
+
+
+def metrics_url():
+    """在文件服务上挂载 /metrics 并返回其地址，供 Prometheus 抓取。"""
+    return file_server.route(METRICS_ROUTE, lambda: ("text/plain; version=0.0.4; charset=utf-8",
+                                                     get_tracer().prometheus().encode("utf-8")))
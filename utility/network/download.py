@@ -0,0 +1,58 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from urllib.parse import urlparse
+
+from utility.cache.asset_cache import is_local_ref
+from utility.metrics import tracer
+from utility.network import http_client
+
+# 每次读取写盘的块大小（字节），大块可减少高带宽链接上的 Python 循环开销
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 1024 * 1024))
+
+# 最近的下载吞吐记录：{"url", "bytes", "seconds", "bytes_per_sec"}
+download_stats = deque(maxlen=500)
+_stats_lock = threading.Lock()
+
+
+def _record_download(url, nbytes, seconds):
+    stat = {
+        "url": url,
+        "bytes": nbytes,
+        "seconds": seconds,
+        "bytes_per_sec": nbytes / seconds if seconds > 0 else float("inf"),
+    }
+    with _stats_lock:
+        download_stats.append(stat)
+    tracer.record_span("download", seconds * 1000, bytes=nbytes, bytes_per_sec=round(stat["bytes_per_sec"]),
+                       host=urlparse(url).netloc)
+    tracer.add("download_bytes", nbytes)
+    return stat
+
+
+def download_file(url, folder, prefix, chunk_size=None):
+    # 缓存命中时可能直接拿到本地文件，无需下载
+    if is_local_ref(url):
+        return url
+
+    # 获取文件扩展名，例如 .mp4 或 .mp3
+    path = urlparse(url).path
+    ext = os.path.splitext(path)[-1]
+
+    # 使用 uuid 保证唯一且简短
+    filename = f"{prefix}_{uuid.uuid4().hex}{ext}"
+    local_path = os.path.join(folder, filename)
+
+    start = time.perf_counter()
+    nbytes = 0
+    r = http_client.get(url, stream=True)
+    r.raise_for_status()
+    with open(local_path, "wb") as f:
+        for chunk in r.iter_content(chunk_size=chunk_size or DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+            nbytes += len(chunk)
+    _record_download(url, nbytes, time.perf_counter() - start)
+
+    return local_path
@@ -0,0 +1,83 @@
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 每个主机保留的空闲长连接数
+POOL_MAXSIZE = 16
+# 建立连接 / 等待响应的超时秒数
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+# 失败重试次数与退避系数（第 n 次重试前等待 backoff_factor * 2^(n-1) 秒）
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+# 这些状态码对幂等请求会自动重试
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_settings = {
+    "pool_maxsize": POOL_MAXSIZE,
+    "connect_timeout": CONNECT_TIMEOUT,
+    "read_timeout": READ_TIMEOUT,
+    "max_retries": MAX_RETRIES,
+    "backoff_factor": BACKOFF_FACTOR,
+}
+# "scheme://host" -> requests.Session
+_sessions = {}
+_lock = threading.Lock()
+
+
+def configure(**settings):
+    """修改连接池参数（pool_maxsize / connect_timeout / read_timeout / max_retries / backoff_factor），已建立的会话会被重建。"""
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise ValueError(f"未知的 HTTP 配置项：{', '.join(sorted(unknown))}")
+    with _lock:
+        _settings.update(settings)
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _build_session():
+    # 只对幂等方法（GET/HEAD/PUT/DELETE 等）按状态码和读超时重试；
+    # 连接阶段的失败请求尚未发出，对 POST 同样安全，因此总是重试
+    retry = Retry(
+        total=_settings["max_retries"],
+        connect=_settings["max_retries"],
+        backoff_factor=_settings["backoff_factor"],
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_settings["pool_maxsize"], max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(url):
+    """返回目标主机共享的长连接会话。"""
+    parsed = urlparse(url)
+    key = f"{parsed.scheme}://{parsed.netloc}"
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = _build_session()
+        return session
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", (_settings["connect_timeout"], _settings["read_timeout"]))
+    return get_session(url).request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
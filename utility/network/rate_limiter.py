@@ -0,0 +1,233 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from utility.metrics import tracer
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只能使用进程内限流
+    fcntl = None
+
+# 每个服务商（及模型）的默认速率：(每秒许可数, 突发上限)。模型未单独配置时使用服务商的配置
+PROVIDER_LIMITS = {
+    "dashscope": (2.0, 2),
+    "vidu": (1.0, 3),
+}
+# 环境变量覆盖，格式如 "dashscope=2/2,vidu:viduq1=0.5/2"
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+# 设置后限流状态保存在该目录下的文件中（文件锁），同一台机器上的多个应用进程共享配额
+RATE_LIMIT_SHARED_DIR = os.getenv("RATE_LIMIT_SHARED_DIR", "")
+# 收到 429 后没有 Retry-After 时暂停的秒数；速率减半，之后每次成功恢复基础速率的 RECOVERY_STEP
+THROTTLE_PAUSE = 2.0
+THROTTLE_FACTOR = 0.5
+RECOVERY_STEP = 0.1
+MIN_RATE_RATIO = 0.1
+# 429 时最多重新排队的次数
+MAX_THROTTLE_RETRIES = 5
+# 排队线程最长睡眠间隔，保证排队位置变化能及时上报
+MAX_SLEEP = 1.0
+
+
+def _parse_limits(text):
+    limits = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        key, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        provider, _, model = key.strip().partition(":")
+        limits[(provider, model or None)] = (float(rate), int(burst or 1))
+    return limits
+
+
+class TokenBucket:
+    """
+    令牌桶限流器：按 rate 每秒补充许可，最多积攒 burst 个。
+
+    等待中的请求按到达顺序排队，只有队首能取许可，不会有请求被插队饿死；
+    排队期间通过 on_wait(前面的请求数, 预计等待秒数) 回调上报。
+    throttle() 在服务商返回 429 时暂停发放并降低速率，之后每次成功逐步恢复。
+    """
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.base_rate = rate
+        self.burst = burst
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._state = {"tokens": float(burst), "updated": time.time(), "paused_until": 0.0, "rate": rate}
+
+    @contextmanager
+    def _locked_state(self):
+        # 调用方已持有 self._cond；共享模式下在这里额外加文件锁并读写状态文件
+        yield self._state
+
+    def _refill(self, state, now):
+        # 429 暂停期间不补充许可
+        since = max(state["updated"], min(state["paused_until"], now))
+        state["tokens"] = min(self.burst, state["tokens"] + (now - since) * state["rate"])
+        state["updated"] = now
+
+    def _head_wait(self, state, now):
+        self._refill(state, now)
+        if now < state["paused_until"]:
+            return state["paused_until"] - now
+        return 0.0 if state["tokens"] >= 1 else (1 - state["tokens"]) / state["rate"]
+
+    def _poll(self, ticket):
+        """返回 (排在前面的请求数, 预计等待秒数)；轮到自己且有许可时直接取走并返回等待 0。"""
+        now = time.time()
+        position = self._queue.index(ticket)
+        with self._locked_state() as state:
+            wait = self._head_wait(state, now)
+            if position == 0 and wait <= 0:
+                state["tokens"] -= 1
+                return 0, 0.0
+            return position, wait + position / state["rate"]
+
+    def acquire(self, on_wait=None):
+        """阻塞直到取得一个许可，返回排队等待的秒数。"""
+        ticket = object()
+        started_at = time.monotonic()
+        reported = None
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    position, wait = self._poll(ticket)
+                    if wait <= 0:
+                        self._queue.popleft()
+                        self._cond.notify_all()
+                        break
+                    if on_wait is None or reported == position:
+                        self._cond.wait(min(wait, MAX_SLEEP))
+                        continue
+                # 回调在锁外执行，避免慢回调阻塞其他请求
+                reported = position
+                on_wait(position, wait)
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                self._cond.notify_all()
+            raise
+
+        waited = time.monotonic() - started_at
+        if waited > 0.01:
+            tracer.record_span("rate_limit.wait", waited * 1000, provider=self.name)
+        return waited
+
+    def throttle(self, retry_after=None):
+        """服务商返回 429：暂停发放许可 retry_after 秒（默认 THROTTLE_PAUSE），并降低速率。"""
+        with self._cond, self._locked_state() as state:
+            now = time.time()
+            self._refill(state, now)
+            state["tokens"] = 0.0
+            state["paused_until"] = max(state["paused_until"], now + (retry_after or THROTTLE_PAUSE))
+            state["rate"] = max(self.base_rate * MIN_RATE_RATIO, state["rate"] * THROTTLE_FACTOR)
+            rate = state["rate"]
+        tracer.add("rate_limited", provider=self.name)
+        print(f"[限流] {self.name} 返回 429，暂停 {retry_after or THROTTLE_PAUSE:.1f} 秒，速率降为 {rate:.2f}/s")
+
+    def on_success(self):
+        with self._cond, self._locked_state() as state:
+            if state["rate"] < self.base_rate:
+                self._refill(state, time.time())
+                state["rate"] = min(self.base_rate, state["rate"] + self.base_rate * RECOVERY_STEP)
+
+    def status(self):
+        """当前排队的请求数和队尾请求的预计等待秒数。"""
+        with self._cond, self._locked_state() as state:
+            waiting = len(self._queue)
+            wait = self._head_wait(state, time.time()) + max(waiting - 1, 0) / state["rate"] if waiting else 0.0
+            return {"name": self.name, "waiting": waiting, "wait_seconds": wait, "rate": state["rate"]}
+
+
+class SharedTokenBucket(TokenBucket):
+    """令牌桶状态保存在文件中并用文件锁保护，同一台机器上的多个进程共享同一份配额。"""
+
+    def __init__(self, name, rate, burst, directory):
+        super().__init__(name, rate, burst)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name.replace(':', '_')}.json")
+
+    @contextmanager
+    def _locked_state(self):
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else dict(self._state)
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_limits = {**{(provider, None): limit for provider, limit in PROVIDER_LIMITS.items()}, **_parse_limits(RATE_LIMITS)}
+
+
+def get_limiter(provider, model=None):
+    """进程内共享的限流器，按 服务商 + 模型 区分；模型没有单独配置时与同一服务商的其他模型共用一个桶。"""
+    key = (provider, model) if (provider, model) in _limits else (provider, None)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            rate, burst = _limits.get(key, (1.0, 1))
+            name = f"{provider}:{key[1]}" if key[1] else provider
+            if RATE_LIMIT_SHARED_DIR and fcntl is not None:
+                limiter = SharedTokenBucket(name, rate, burst, RATE_LIMIT_SHARED_DIR)
+            else:
+                if RATE_LIMIT_SHARED_DIR:
+                    print("[限流] 当前系统不支持文件锁，改为进程内限流")
+                limiter = TokenBucket(name, rate, burst)
+            _limiters[key] = limiter
+        return limiter
+
+
+def queue_status():
+    """所有限流器的排队情况，供页面展示。"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.status() for limiter in limiters]
+
+
+def describe_wait(position, wait):
+    return f"排队中：前面还有 {position} 个请求，预计等待 {wait:.0f} 秒"
+
+
+def retry_after_seconds(response):
+    value = getattr(response, "headers", {}).get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def call_limited(provider, send, model=None, is_throttled=None, retry_after=retry_after_seconds, on_wait=None,
+                 max_retries=MAX_THROTTLE_RETRIES):
+    """
+    在限流器许可下调用 send() 并返回其结果。
+
+    is_throttled(result) 判断服务商是否返回了限流（默认看 HTTP 429）；被限流时降低该服务商的速率、
+    重新排队后再试，最多 max_retries 次，之后返回最后一次的结果交给调用方按普通失败处理。
+    """
+    is_throttled = is_throttled or (lambda result: getattr(result, "status_code", None) == 429)
+    limiter = get_limiter(provider, model)
+    for _ in range(max_retries + 1):
+        limiter.acquire(on_wait=on_wait)
+        result = send()
+        if not is_throttled(result):
+            limiter.on_success()
+            return result
+        limiter.throttle(retry_after(result))
+    return result
@@ -0,0 +1,103 @@
+import threading
+import time
+from queue import Queue
+
+from utility.metrics import tracer
+
+# 相邻阶段之间最多积压的条目数，上游超出后会阻塞等待（背压）
+DEFAULT_QUEUE_SIZE = 2
+
+_DONE = object()
+
+
+class PipelineStage:
+    """
+    流水线中的一个阶段。
+
+    fn(item) 直接修改传入的 dict；抛出异常时该条目被标记为失败，
+    错误记录在 item["errors"][name] 中，后续阶段不再处理它。
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size
+
+
+class Pipeline:
+    """
+    由多个阶段组成的有界流水线：每个条目完成一个阶段后立即进入下一个阶段，
+    不必等待同一阶段的其他条目。各阶段在后台线程中运行，run() 在调用方线程中
+    按完成顺序产出条目，因此既可以在命令行中使用，也可以在 Streamlit 脚本里更新页面。
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    def _run_stage(self, stage, inbox, outbox, next_workers, remaining, lock):
+        while True:
+            entry = inbox.get()
+            if entry is _DONE:
+                break
+            item, queued_at = entry
+            if not item.get("failed"):
+                # 每个条目在每个阶段记一个 span：排队等待时间 + 处理耗时
+                queue_wait_ms = (time.monotonic() - queued_at) * 1000
+                try:
+                    with tracer.span(f"pipeline.{stage.name}", scene=item.get("idx"),
+                                     queue_wait_ms=round(queue_wait_ms, 1)):
+                        stage.fn(item)
+                except Exception as e:
+                    item.setdefault("errors", {})[stage.name] = str(e)
+                    item["failed"] = True
+            outbox.put((item, time.monotonic()))
+
+        # 本阶段最后一个退出的线程负责通知下游结束
+        with lock:
+            remaining[stage.name] -= 1
+            last = remaining[stage.name] == 0
+        if last:
+            for _ in range(next_workers):
+                outbox.put(_DONE)
+
+    def _feed(self, source, inbox, workers, source_error):
+        try:
+            for item in source:
+                inbox.put((item, time.monotonic()))
+        except Exception as e:
+            source_error.append(e)
+        finally:
+            for _ in range(workers):
+                inbox.put(_DONE)
+
+    def run(self, source):
+        """把 source 中的条目依次送入流水线，按完成顺序产出处理后的条目。"""
+        queues = [Queue(maxsize=stage.queue_size) for stage in self.stages]
+        output = Queue()
+        remaining = {stage.name: stage.workers for stage in self.stages}
+        lock = threading.Lock()
+        source_error = []
+
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0], self.stages[0].workers, source_error),
+                                    daemon=True)]
+        for i, stage in enumerate(self.stages):
+            is_last = i == len(self.stages) - 1
+            outbox = output if is_last else queues[i + 1]
+            next_workers = 1 if is_last else self.stages[i + 1].workers
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._run_stage,
+                    args=(stage, queues[i], outbox, next_workers, remaining, lock),
+                    daemon=True))
+        for thread in threads:
+            thread.start()
+
+        while True:
+            entry = output.get()
+            if entry is _DONE:
+                break
+            yield entry[0]
+
+        if source_error:
+            raise source_error[0]
@@ -0,0 +1,79 @@
+from utility.image.batch_generator import build_image_prompt
+from utility.pipeline.pipeline import Pipeline, PipelineStage
+from utility.vidu.task_scheduler import TASK_AUDIO, TASK_VIDEO, ViduTaskScheduler, build_audio_prompt
+
+# 各阶段的并发数：图片生成受 DashScope 配额限制，Vidu 任务以轮询等待为主可以多开
+IMAGE_WORKERS = 2
+CLIP_WORKERS = 5
+DOWNLOAD_WORKERS = 4
+
+
+def scene_source(sentences):
+    """把逐句产出的剧本（列表或 stream_script_sentences 生成器）转换成场景条目。"""
+    prev_text = None
+    for idx, text in enumerate(sentences):
+        yield {
+            "idx": idx,
+            "text": text,
+            "prev_text": prev_text,
+            "image_url": None,
+            "video_url": None,
+            "audio_url": None,
+            "video_path": None,
+            "audio_path": None,
+            "errors": {},
+        }
+        prev_text = text
+
+
+def build_scene_pipeline(generate_image, style, vidu_api_key, download=None, poller=None, cache=None,
+                         audio_duration=None, image_workers=IMAGE_WORKERS, clip_workers=CLIP_WORKERS,
+                         download_workers=DOWNLOAD_WORKERS):
+    """
+    构造 文本 → 图片 → 视频+音频 → 本地下载 的场景流水线。
+
+    generate_image(style, prompt) 返回图片 URL（即 generate_single_caption_image）；
+    download(url, prefix) 返回本地文件路径，为 None 时跳过下载阶段。
+    """
+
+    def image_stage(scene):
+        prompt = build_image_prompt(scene["text"], scene["prev_text"])
+        scene["image_url"] = generate_image(style, prompt)
+
+    def clip_stage(scene):
+        # 同一场景的视频和音频任务一起提交，在同一个循环里轮询
+        scheduler = ViduTaskScheduler(vidu_api_key, poller=poller, cache=cache)
+        idx = scene["idx"]
+        scheduler.submit_img2video(idx, scene["image_url"], scene["text"])
+        scheduler.submit_text2audio(idx, build_audio_prompt(scene["text"]), duration=audio_duration)
+        result = scheduler.run()[idx]
+        scene["video_url"] = result[TASK_VIDEO]
+        scene["audio_url"] = result[TASK_AUDIO]
+        if result["errors"]:
+            raise Exception("；".join(f"{kind}: {message}" for kind, message in result["errors"].items()))
+
+    def download_stage(scene):
+        idx = scene["idx"]
+        scene["video_path"] = download(scene["video_url"], f"video{idx}")
+        scene["audio_path"] = download(scene["audio_url"], f"audio{idx}")
+
+    stages = [
+        PipelineStage("image", image_stage, workers=image_workers),
+        PipelineStage("clip", clip_stage, workers=clip_workers),
+    ]
+    if download is not None:
+        stages.append(PipelineStage("download", download_stage, workers=download_workers))
+    return Pipeline(stages)
+
+
+def run_scene_pipeline(sentences, generate_image, style, vidu_api_key, on_scene=None, **options):
+    """
+    运行场景流水线并按场景顺序返回全部结果；on_scene(scene) 在每个场景完成时于调用方线程回调。
+    """
+    pipeline = build_scene_pipeline(generate_image, style, vidu_api_key, **options)
+    scenes = []
+    for scene in pipeline.run(scene_source(sentences)):
+        scenes.append(scene)
+        if on_scene is not None:
+            on_scene(scene)
+    return sorted(scenes, key=lambda scene: scene["idx"])
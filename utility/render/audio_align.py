@@ -0,0 +1,92 @@
+import subprocess
+import wave
+
+import numpy as np
+from moviepy.config import get_setting
+
+# 背景音比画面短时循环播放，循环接缝处等功率交叉淡化的秒数
+LOOP_CROSSFADE = 0.5
+# 背景音比画面长时截断，结尾淡出的秒数
+TRIM_FADE_OUT = 0.3
+# 每个场景音频首尾的短淡入淡出，避免场景切换处出现爆音
+EDGE_FADE = 0.01
+CHANNELS = 2
+
+
+def load_samples(path, fps, channels=CHANNELS):
+    """用 ffmpeg 把音频解码为 float32 数组（采样数 × 声道数），统一采样率和声道数。"""
+    cmd = [get_setting("FFMPEG_BINARY"), "-v", "error", "-i", path, "-vn", "-f", "f32le", "-acodec", "pcm_f32le",
+           "-ac", str(channels), "-ar", str(fps), "-"]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise Exception(f"音频解码失败：{result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, channels)
+
+
+def _fade(samples, length, fade_in):
+    length = min(length, len(samples))
+    if length <= 0:
+        return
+    ramp = np.linspace(0.0, 1.0, length, dtype=np.float32)[:, None]
+    if fade_in:
+        samples[:length] *= ramp
+    else:
+        samples[-length:] *= ramp[::-1]
+
+
+def align_samples(samples, target, fps, crossfade=LOOP_CROSSFADE, fade_out=TRIM_FADE_OUT, edge_fade=EDGE_FADE):
+    """
+    把音频对齐到 target 个采样：比目标长时截断并淡出；比目标短时循环拼接，
+    第 k 次循环的开头与上一次循环的结尾重叠 crossfade 秒并做等功率交叉淡化。返回新数组。
+    """
+    channels = samples.shape[1] if samples.ndim == 2 else CHANNELS
+    if target <= 0:
+        return np.zeros((0, channels), dtype=np.float32)
+    if len(samples) == 0:
+        return np.zeros((target, channels), dtype=np.float32)
+
+    n = len(samples)
+    if n >= target:
+        out = samples[:target].astype(np.float32, copy=True)
+        if n > target:
+            _fade(out, int(fade_out * fps), fade_in=False)
+    else:
+        overlap = min(int(crossfade * fps), n // 2)
+        step = n - overlap
+        # 输出第 i 个采样来自第 k 次循环的第 j 个采样；j < overlap 时与上一次循环的第 j + step 个采样混合
+        loop, offset = np.divmod(np.arange(target), step)
+        out = samples[offset].astype(np.float32)
+        blend = (loop > 0) & (offset < overlap)
+        if overlap and blend.any():
+            angle = (offset[blend] / overlap * (np.pi / 2))[:, None]
+            out[blend] = samples[offset[blend]] * np.sin(angle) + samples[offset[blend] + step] * np.cos(angle)
+    edge = int(edge_fade * fps)
+    _fade(out, edge, fade_in=True)
+    _fade(out, edge, fade_in=False)
+    return out
+
+
+def align_audio(path, duration, fps):
+    """解码音频并对齐到 duration 秒（通常是场景视频的时长）。"""
+    return align_samples(load_samples(path, fps), int(round(duration * fps)), fps)
+
+
+def aligned_track(audio_paths, durations, fps):
+    """
+    把各场景的音频分别对齐到对应场景的时长后首尾相接成一条音轨。
+    每段的采样数按累计时长取整，场景再多也不会累积误差导致音画逐渐错位。
+    """
+    bounds = np.round(np.cumsum([0.0, *durations]) * fps).astype(int)
+    return np.concatenate([align_samples(load_samples(path, fps), end - start, fps)
+                           for path, start, end in zip(audio_paths, bounds[:-1], bounds[1:])])
+
+
+def write_wav(samples, path, fps):
+    """把 float32 采样写成 16 位 PCM WAV 文件。"""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(samples.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(fps)
+        f.writeframes(pcm.tobytes())
+    return path
@@ -0,0 +1,52 @@
+import re
+import subprocess
+
+from moviepy.config import get_setting
+
+# 解析 ffmpeg -i 输出的媒体信息（imageio-ffmpeg 自带的 ffmpeg 没有 ffprobe）；只读容器头，不解码
+_VIDEO_STREAM = re.compile(r"Video: (?P<codec>\w+)(?P<tags>(?: \([^)]*\))*), (?P<pix_fmt>\w+)(?:\([^)]*\))?[^,]*, "
+                           r"(?P<width>\d+)x(?P<height>\d+)")
+_FPS = re.compile(r"([\d.]+k?) fps")
+_TBN = re.compile(r"([\d.]+k?) tbn")
+_DURATION = re.compile(r"Duration: (\d+):(\d+):([\d.]+)")
+
+
+def _media_info(path):
+    result = subprocess.run([get_setting("FFMPEG_BINARY"), "-hide_banner", "-i", path], capture_output=True,
+                            text=True)
+    return result.stderr
+
+
+def _parse_duration(info):
+    match = _DURATION.search(info)
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def probe_duration(path):
+    """从容器元数据读取媒体时长（秒），本地路径和 URL 均可；无法解析时返回 None。"""
+    return _parse_duration(_media_info(path))
+
+
+def probe_video(path):
+    """
+    读取文件的时长和第一条视频流参数，返回
+    {"codec", "tags", "pix_fmt", "width", "height", "fps", "tbn", "duration"}；无法解析时返回 None。
+    """
+    info = _media_info(path)
+    duration = _parse_duration(info)
+    line = next((line for line in info.splitlines() if " Video: " in line), None)
+    stream = _VIDEO_STREAM.search(line) if line else None
+    if duration is None or stream is None:
+        return None
+    fps, tbn = _FPS.search(line), _TBN.search(line)
+    return {
+        **stream.groupdict(),
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "fps": fps.group(1) if fps else None,
+        "tbn": tbn.group(1) if tbn else None,
+        "duration": duration,
+    }
@@ -0,0 +1,179 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# 字幕字体文件路径（.ttf / .ttc / .otf）；未设置或缺少字幕中的字符时，依次尝试下面的常见中文字体
+SUBTITLE_FONT = os.getenv("SUBTITLE_FONT", "")
+FONT_CANDIDATES = [
+    # macOS
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "/System/Library/Fonts/Hiragino Sans GB.ttc",
+    "/Library/Fonts/Arial Unicode.ttf",
+    # Windows
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "C:/Windows/Fonts/simsun.ttc",
+    # Linux
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+]
+# 字幕最多占画面宽度的比例，超出时自动换行
+MAX_WIDTH_RATIO = 0.9
+LINE_SPACING = 1.2
+
+
+def _font_paths(preferred=None):
+    paths = [preferred or SUBTITLE_FONT, *FONT_CANDIDATES]
+    return [path for path in dict.fromkeys(paths) if path and os.path.exists(path)]
+
+
+@lru_cache(maxsize=32)
+def _load_font(path, fontsize):
+    if path is None:
+        try:
+            return ImageFont.load_default(size=fontsize)
+        except TypeError:
+            # Pillow < 10.1 的内置字体不能调整字号
+            return ImageFont.load_default()
+    return ImageFont.truetype(path, fontsize)
+
+
+def _glyph_pixels(font, char):
+    image = Image.new("L", (48, 48))
+    ImageDraw.Draw(image).text((8, 4), char, font=font, fill=255)
+    return image.tobytes()
+
+
+@lru_cache(maxsize=4096)
+def _has_glyph(path, char):
+    # 字体缺少的字符会被画成 .notdef（方框或空白），与私有区字符的渲染结果相同
+    font = _load_font(path, 32)
+    return _glyph_pixels(font, char) != _glyph_pixels(font, "\U0010FFFD")
+
+
+@lru_cache(maxsize=256)
+def pick_font(text, preferred=None):
+    """返回能显示 text 中所有字符的第一个字体文件路径；都不满足时返回第一个可用字体，没有可用字体时返回 None。"""
+    paths = _font_paths(preferred)
+    chars = {char for char in text if not char.isspace()}
+    for path in paths:
+        if all(_has_glyph(path, char) for char in chars):
+            return path
+    if paths:
+        print(f"[字幕] 没有找到能显示全部字符的字体，使用 {paths[0]}；可通过 SUBTITLE_FONT 指定字体文件")
+        return paths[0]
+    print("[字幕] 没有找到可用的字体文件，使用 Pillow 内置字体；可通过 SUBTITLE_FONT 指定字体文件")
+    return None
+
+
+def _wrap(draw, text, font, max_width, stroke_width):
+    """按像素宽度逐字符换行（中文没有空格分词），返回各行文本。"""
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        line = ""
+        for char in paragraph:
+            if line and draw.textlength(line + char, font=font) + 2 * stroke_width > max_width:
+                lines.append(line)
+                line = char
+            else:
+                line += char
+        lines.append(line)
+    return lines
+
+
+@lru_cache(maxsize=256)
+def render_caption(text, frame_width, fontsize, font=None, color=(255, 255, 255), stroke_color=(0, 0, 0),
+                   stroke_width=2):
+    """把字幕渲染成裁剪到文字范围的 RGBA 数组（只读，按参数缓存），多行时居中对齐。"""
+    font_file = _load_font(pick_font(text, font), fontsize)
+    draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    lines = _wrap(draw, text, font_file, frame_width * MAX_WIDTH_RATIO, stroke_width)
+    line_height = int(fontsize * LINE_SPACING)
+    width = int(max(draw.textlength(line, font=font_file) for line in lines)) + 2 * stroke_width + 2
+    height = line_height * len(lines) + 2 * stroke_width
+
+    image = Image.new("RGBA", (max(width, 1), max(height, 1)), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        x = (width - draw.textlength(line, font=font_file)) / 2
+        draw.text((x, stroke_width + i * line_height), line, font=font_file, fill=color,
+                  stroke_width=stroke_width, stroke_fill=stroke_color)
+
+    rgba = np.asarray(image)
+    # 去掉四周全透明的边，逐帧混合的区域越小越快
+    rows = np.flatnonzero(rgba[:, :, 3].any(axis=1))
+    cols = np.flatnonzero(rgba[:, :, 3].any(axis=0))
+    if len(rows) == 0:
+        rgba = rgba[:0, :0]
+    else:
+        rgba = rgba[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    rgba = np.ascontiguousarray(rgba)
+    rgba.setflags(write=False)
+    return rgba
+
+
+class SubtitleOverlay:
+    """
+    预先算好的字幕叠加层：逐帧只对字幕所在的矩形区域做 alpha 混合，画面其余部分原样复制。
+
+    用法：clip.fl_image(SubtitleOverlay(rgba, frame_size, top))
+    """
+
+    def __init__(self, rgba, frame_size, top):
+        frame_w, frame_h = frame_size
+        h, w = rgba.shape[:2]
+        left = (frame_w - w) // 2
+        # 裁掉超出画面的部分
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + w, frame_w), min(top + h, frame_h)
+        self.box = (x0, y0, x1, y1)
+        if x1 <= x0 or y1 <= y0:
+            self.box = None
+            return
+        crop = rgba[y0 - top:y1 - top, x0 - left:x1 - left].astype(np.float32)
+        alpha = crop[:, :, 3:4] / 255.0
+        # 预乘颜色和 (1 - alpha)，每帧只需一次乘加
+        self.premultiplied = crop[:, :, :3] * alpha
+        self.inverse_alpha = 1.0 - alpha
+
+    def __call__(self, frame):
+        if self.box is None:
+            return frame
+        x0, y0, x1, y1 = self.box
+        out = np.array(frame, copy=True)
+        region = out[y0:y1, x0:x1, :3]
+        region[...] = (region * self.inverse_alpha + self.premultiplied + 0.5).astype(np.uint8)
+        return out
+
+
+def subtitle_overlay(text, frame_size, fontsize, bottom_margin=150, font=None, stroke_width=2):
+    """字幕水平居中，顶部距画面底边 bottom_margin 像素；多行字幕放不下时整体上移。"""
+    rgba = render_caption(text, frame_size[0], fontsize, font=font or None, stroke_width=stroke_width)
+    top = min(frame_size[1] - bottom_margin, frame_size[1] - rgba.shape[0] - 10)
+    return SubtitleOverlay(rgba, frame_size, top)
+
+
+def _srt_time(seconds):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def write_srt(captions, durations, path):
+    """按各场景时长依次排列字幕，写出 SRT 字幕文件（软字幕），返回文件路径。"""
+    start = 0.0
+    with open(path, "w", encoding="utf-8") as f:
+        for i, (caption, duration) in enumerate(zip(captions, durations)):
+            f.write(f"{i + 1}\n{_srt_time(start)} --> {_srt_time(start + duration)}\n{caption.strip()}\n\n")
+            start += duration
+    return path
@@ -0,0 +1,411 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from moviepy.config import get_setting
+from moviepy.audio.AudioClip import AudioArrayClip
+from moviepy.editor import VideoFileClip
+
+from utility.cache.asset_cache import AssetCache
+from utility.metrics import tracer
+from utility.network.download import download_file
+from utility.render.audio_align import align_audio, aligned_track, write_wav
+from utility.render.probe import probe_video
+from utility.render.subtitles import SUBTITLE_FONT, subtitle_overlay, write_srt
+from utility.storage.output_store import content_output_path, sidecar_subtitle_path
+from utility.storage.workspace import get_workspace_manager
+
+# 已编码场景片段的缓存目录与大小上限（字节）
+SEGMENT_CACHE_DIR = os.getenv("SEGMENT_CACHE_DIR", ".segment_cache")
+SEGMENT_CACHE_MAX_BYTES = int(os.getenv("SEGMENT_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# 场景片段的编码与字幕参数；任何一项变化都会让缓存的片段失效
+RENDER_SETTINGS = {
+    "codec": "libx264",
+    "audio_codec": "aac",
+    "audio_fps": 44100,
+    "fps": 25,
+    "pix_fmt": "yuv420p",
+    "fontsize": 48,
+    "font": SUBTITLE_FONT,  # 字体文件路径，留空时自动选择系统中可显示字幕的中文字体
+    "stroke_width": 2,
+    "subtitle_bottom_margin": 150,
+}
+
+# 渲染档位：preview 用于快速检查节奏和字幕（480p、ultrafast、低码率），final 为正式输出。
+# width x height 为片段的统一画面尺寸：各场景等比缩放后补黑边，拼接后是同一个尺寸的视频流；
+# crf 越大码率越低；编码线程数按可用核数自动分配
+RENDER_PROFILES = {
+    "preview": {**RENDER_SETTINGS, "width": 854, "height": 480, "preset": "ultrafast", "crf": 32,
+                "audio_bitrate": "96k"},
+    "final": {**RENDER_SETTINGS, "width": 1920, "height": 1080, "preset": "medium", "crf": 20,
+              "audio_bitrate": "192k"},
+}
+# 字幕字号、边距、描边按 1080p 画面设定，按片段高度等比缩放
+SUBTITLE_REFERENCE_HEIGHT = 1080
+DEFAULT_PROFILE = os.getenv("RENDER_PROFILE", "final")
+
+# 为 1 时把字幕烧进画面（需要逐场景重新编码）；默认输出软字幕，画面参数一致时视频流直接复制
+BURN_SUBTITLES = os.getenv("BURN_SUBTITLES", "0") == "1"
+# 可以直接复制拼接、浏览器也能播放的 (视频编码, 像素格式)，与重新编码路径的输出一致
+COPYABLE_FORMATS = {("h264", "yuv420p")}
+
+# 并行渲染场景片段的进程数，设为 1 时串行渲染
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))
+# 同时下载的素材文件数
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 8))
+
+_segment_cache = None
+
+
+def get_segment_cache():
+    global _segment_cache
+    if _segment_cache is None:
+        _segment_cache = AssetCache(root=SEGMENT_CACHE_DIR, max_bytes=SEGMENT_CACHE_MAX_BYTES)
+    return _segment_cache
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_render_profile(profile=None):
+    """按名称取渲染档位，None 时使用 RENDER_PROFILE 环境变量指定的默认档位。"""
+    profile = profile or DEFAULT_PROFILE
+    if profile not in RENDER_PROFILES:
+        raise Exception(f"未知的渲染档位：{profile}（可选：{'、'.join(RENDER_PROFILES)}）")
+    return RENDER_PROFILES[profile]
+
+
+def segment_key(video_path, audio_path, caption, settings=RENDER_SETTINGS):
+    """场景片段的缓存键：输入视频、音频的内容摘要 + 字幕 + 渲染参数。"""
+    payload = json.dumps({
+        "video": _file_digest(video_path),
+        "audio": _file_digest(audio_path),
+        "caption": caption,
+        "settings": settings,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def fit_size(size, frame_size):
+    # 等比缩放后能放进 frame_size 的最大尺寸，宽高取偶数
+    scale = min(frame_size[0] / size[0], frame_size[1] / size[1])
+    return (max(2, round(size[0] * scale / 2) * 2), max(2, round(size[1] * scale / 2) * 2))
+
+
+def letterbox(size, frame_size):
+    # 返回把 size 大小的帧居中放进 frame_size 黑色画布的函数
+    width, height = size
+    left, top = (frame_size[0] - width) // 2, (frame_size[1] - height) // 2
+
+    def pad(frame):
+        canvas = np.zeros((frame_size[1], frame_size[0], 3), dtype=np.uint8)
+        canvas[top:top + height, left:left + width] = frame[:height, :width, :3]
+        return canvas
+    return pad
+
+
+def _encode_params(settings):
+    # 固定像素格式和 SAR，保证各片段的视频流参数一致，可以用 concat 直接复制拼接
+    params = ["-pix_fmt", settings["pix_fmt"], "-vf", "setsar=1"]
+    if "crf" in settings:
+        params += ["-crf", str(settings["crf"])]
+    return params
+
+
+def _encode_segment(video_path, audio_path, caption, output_path, settings):
+    # 合成单个场景（视频 + 字幕 + 背景音）并编码为独立片段，返回编码统计 {"seconds", "frames"}；
+    # 可能在子进程中执行，由调用方在主进程记录 span
+    started_at = time.perf_counter()
+    frame_size = (settings["width"], settings["height"])
+    # 在解码阶段就把画面等比缩放到能放进统一尺寸的最大偶数宽高（libx264 要求），其余部分补黑边
+    probe = probe_video(video_path)
+    target_resolution = None
+    if probe:
+        fit = fit_size((probe["width"], probe["height"]), frame_size)
+        if fit != (probe["width"], probe["height"]):
+            target_resolution = (fit[1], fit[0])
+    video_clip = VideoFileClip(video_path, target_resolution=target_resolution)
+    try:
+        scale = frame_size[1] / SUBTITLE_REFERENCE_HEIGHT
+        # 字幕只用 Pillow 渲染一次，逐帧只混合字幕所在区域，不再依赖 ImageMagick 和 CompositeVideoClip
+        overlay = subtitle_overlay(caption, frame_size, max(1, round(settings["fontsize"] * scale)),
+                                   bottom_margin=round(settings["subtitle_bottom_margin"] * scale),
+                                   font=settings["font"], stroke_width=max(1, round(settings["stroke_width"] * scale)))
+        if tuple(video_clip.size) != frame_size:
+            pad = letterbox(video_clip.size, frame_size)
+            composite_clip = video_clip.fl_image(lambda frame: overlay(pad(frame)))
+        else:
+            composite_clip = video_clip.fl_image(overlay)
+        # 背景音按画面时长循环 / 截断对齐，片段时长不会被音频撑长，也不会出现结尾静音
+        audio_clip = AudioArrayClip(align_audio(audio_path, video_clip.duration, settings["audio_fps"]),
+                                    fps=settings["audio_fps"])
+        composite_clip = composite_clip.set_audio(audio_clip)
+        # moviepy 默认把临时音轨写到当前目录，放到片段所在的工作目录里，避免并发渲染时互相覆盖
+        temp_audiofile = f"{os.path.splitext(output_path)[0]}_audio.m4a"
+        composite_clip.write_videofile(output_path, codec=settings["codec"], audio_codec=settings["audio_codec"],
+                                       audio_fps=settings["audio_fps"], fps=settings["fps"],
+                                       preset=settings.get("preset", "medium"), threads=settings.get("threads"),
+                                       audio_bitrate=settings.get("audio_bitrate"),
+                                       ffmpeg_params=_encode_params(settings),
+                                       temp_audiofile=temp_audiofile, logger=None)
+        frames = int(video_clip.duration * settings["fps"])
+    finally:
+        video_clip.close()
+    return {"seconds": time.perf_counter() - started_at, "frames": frames}
+
+
+def _write_concat_list(paths, list_path):
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", r"'\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+
+def concat_segments(segment_paths, output_path):
+    """用 ffmpeg concat demuxer 直接拼接编码参数一致的片段，不重新编码。"""
+    list_path = _write_concat_list(segment_paths, f"{output_path}.{uuid.uuid4().hex}.txt")
+    try:
+        cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+               "-i", list_path, "-c", "copy", "-movflags", "+faststart", output_path]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"片段拼接失败：{result.stderr.strip()}")
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
+def can_stream_copy(probes):
+    """所有场景视频的编码、profile、像素格式、分辨率、帧率和时间基都相同时，可以不重新编码直接拼接。"""
+    if not probes or any(probe is None for probe in probes):
+        return False
+    signatures = {tuple(probe[field] for field in ("codec", "tags", "pix_fmt", "width", "height", "fps", "tbn"))
+                  for probe in probes}
+    return len(signatures) == 1 and (probes[0]["codec"], probes[0]["pix_fmt"]) in COPYABLE_FORMATS
+
+
+def copy_merge(scenes, durations, output_path, workdir, settings=RENDER_PROFILES[DEFAULT_PROFILE]):
+    """
+    视频流直接复制拼接，背景音逐场景对齐到画面时长（见 audio_align）后编码成一条音轨，
+    字幕作为软字幕轨道（mov_text）封装进同一个文件；scenes 为 [(video_path, audio_path, caption)]。
+    返回写出的 SRT 字幕文件路径。
+    """
+    video_paths, audio_paths, captions = zip(*scenes)
+    list_path = _write_concat_list(video_paths, os.path.join(workdir, "videos.txt"))
+    srt_path = write_srt(captions, durations, os.path.join(workdir, "subtitles.srt"))
+
+    with tracer.span("render.audio_align", segments=len(scenes)):
+        audio_track = write_wav(aligned_track(audio_paths, durations, settings["audio_fps"]),
+                                os.path.join(workdir, "audio.wav"), settings["audio_fps"])
+
+    cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+           "-i", audio_track, "-i", srt_path,
+           "-map", "0:v:0", "-map", "1:a", "-map", "2:s",
+           "-c:v", "copy", "-c:a", settings["audio_codec"], "-b:a", settings.get("audio_bitrate", "128k"),
+           "-c:s", "mov_text",
+           "-movflags", "+faststart", output_path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"流复制合成失败：{result.stderr.strip()}")
+    return srt_path
+
+
+class SegmentRenderer:
+    """
+    逐个接收场景并立即开始编码的片段渲染器；segments 为预计的场景数，用于分配进程数和编码线程数。
+
+    命中缓存的场景直接复用；其余场景在 workers > 1 时提交到进程池，否则就地串行编码。
+    进程池无法启动或工作进程异常退出时，对受影响的场景退回串行渲染。
+    本次用到的片段在缓存中保持固定，直到 close()（拼接完成）后才可能被淘汰。
+    """
+
+    def __init__(self, workdir, settings=RENDER_PROFILES[DEFAULT_PROFILE], workers=None, segments=None):
+        self.workdir = workdir
+        self.settings = settings
+        self.cache = get_segment_cache()
+        workers = RENDER_WORKERS if workers is None else workers
+        # 已知场景数时，同时编码的片段数不会超过场景数，多出的核分给每个片段的编码线程
+        if segments:
+            workers = max(1, min(workers, segments))
+        # Streamlit 服务进程里有大量线程（后台任务、文件服务、持有锁的统计线程），fork 出的子进程可能死锁，
+        # 工作进程一律用 spawn 启动
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) \
+            if workers > 1 else None
+        # 并行编码的进程平分可用核数；线程数不影响输出，不计入缓存键
+        self.encode_settings = {**settings, "threads": max(1, (os.cpu_count() or 1) // max(workers, 1))}
+        # 场景编号 -> 片段路径 / 缓存键
+        self.paths = {}
+        self.keys = {}
+        # 场景编号 -> (缓存键, 渲染参数, future)
+        self.pending = {}
+
+    def _record(self, idx, stats):
+        tracer.record_span("render.segment", stats["seconds"] * 1000, scene=idx, frames=stats["frames"],
+                           fps=round(stats["frames"] / stats["seconds"], 1) if stats["seconds"] > 0 else None)
+        tracer.add("render_frames", stats["frames"])
+
+    def submit(self, idx, video_path, audio_path, caption):
+        key = segment_key(video_path, audio_path, caption, self.settings)
+        if idx not in self.keys:
+            self.cache.pin(key)
+        self.keys[idx] = key
+        cached = self.cache.get_path(key)
+        if cached is not None:
+            self.paths[idx] = cached
+            tracer.add("render_segment_cache_hits")
+            return
+        job = (video_path, audio_path, caption, os.path.join(self.workdir, f"segment{idx}_{key[:16]}.mp4"))
+        future = None
+        if self.executor is not None:
+            try:
+                future = self.executor.submit(_encode_segment, *job, self.encode_settings)
+            except (OSError, RuntimeError) as e:
+                print(f"[并行渲染不可用，改为串行] {e}")
+                self.executor.shutdown(wait=False)
+                self.executor = None
+        if future is None:
+            self._record(idx, _encode_segment(*job, self.encode_settings))
+        self.pending[idx] = (key, job, future)
+
+    def results(self):
+        """等待所有场景编码完成，按场景顺序返回片段路径。"""
+        for idx, (key, job, future) in sorted(self.pending.items()):
+            if future is not None:
+                try:
+                    self._record(idx, future.result())
+                except BrokenProcessPool as e:
+                    print(f"[渲染进程异常退出，场景 {idx + 1} 改为串行渲染] {e}")
+                    self._record(idx, _encode_segment(*job, self.encode_settings))
+            self.paths[idx] = self.cache.put_file(key, job[3])
+        self.pending.clear()
+        return [self.paths[idx] for idx in sorted(self.paths)]
+
+    def output_key(self):
+        """按场景顺序的片段缓存键决定最终视频的内容，用作输出文件名。"""
+        return hashlib.sha256(",".join(self.keys[idx] for idx in sorted(self.keys)).encode()).hexdigest()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        for key in self.keys.values():
+            self.cache.unpin(key)
+        self.keys = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _stream_copy_key(scenes, settings):
+    return hashlib.sha256(",".join(
+        segment_key(video_path, audio_path, caption, {"mode": "copy", "audio_codec": settings["audio_codec"],
+                                                      "audio_fps": settings["audio_fps"],
+                                                      "audio_bitrate": settings.get("audio_bitrate")})
+        for video_path, audio_path, caption in scenes).encode()).hexdigest()
+
+
+def _publish(workspace, output_key, output_path, produce):
+    """
+    在工作目录里生成最终视频（及字幕）后移动到输出位置，其他会话不会读到写了一半的文件。
+    未指定 output_path 时按 output_key 命名，已存在则直接复用。produce(path) 返回附带的字幕文件或 None。
+    """
+    if output_path is None:
+        output_path = content_output_path(output_key, ".mp4")
+        if os.path.exists(output_path):
+            tracer.add("render_output_reused")
+            return output_path
+    final_path = workspace.file(f"final{os.path.splitext(output_path)[-1]}")
+    srt_path = produce(final_path)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    if srt_path is not None:
+        shutil.move(srt_path, sidecar_subtitle_path(output_path))
+    elif os.path.exists(sidecar_subtitle_path(output_path)):
+        # 覆盖同一路径时去掉上一次留下的软字幕
+        os.remove(sidecar_subtitle_path(output_path))
+    shutil.move(final_path, output_path)
+    return output_path
+
+
+def merge_videos_and_audios(video_urls, audio_urls, captions, workers=None, download_workers=DOWNLOAD_WORKERS,
+                            output_path=None, burn_subtitles=BURN_SUBTITLES, profile=None):
+    """
+    把各场景的视频、背景音和字幕合成最终视频，返回输出文件路径。
+
+    默认（不烧字幕）先探测所有场景视频：编码参数一致时视频流直接复制拼接，只编码音轨，
+    字幕作为软字幕轨道写入并在视频旁生成同名 .srt，几秒内即可完成；参数不一致或 burn_subtitles 为真时，
+    为每个场景渲染（或复用）一个烧入字幕的已编码片段，再无重编码地拼接。
+
+    所有素材并发下载；烧字幕时某个场景的视频和音频都落盘后立即开始编码该场景。
+    下载和编码在本次合成独占的工作目录中进行，多个会话可以同时合成。
+    未指定 output_path 时输出按内容命名，相同的合成直接复用已有文件。
+    profile 选择渲染档位（见 RENDER_PROFILES，默认 RENDER_PROFILE）；场景视频高于档位画面时不走流复制，
+    按档位缩放重新编码，保证输出分辨率与档位一致。
+    """
+    profile = profile or DEFAULT_PROFILE
+    settings = get_render_profile(profile)
+    with get_workspace_manager().create("merge") as workspace:
+        with ThreadPoolExecutor(max_workers=download_workers) as downloader, \
+                SegmentRenderer(workspace.path, settings=settings, workers=workers,
+                                segments=len(video_urls)) as renderer:
+            futures = {}
+            for i, (v_url, a_url) in enumerate(zip(video_urls, audio_urls)):
+                futures[downloader.submit(download_file, v_url, workspace.path, f"video{i}")] = (i, "video")
+                futures[downloader.submit(download_file, a_url, workspace.path, f"audio{i}")] = (i, "audio")
+
+            downloaded = {}
+            for future in as_completed(futures):
+                i, kind = futures[future]
+                scene = downloaded.setdefault(i, {})
+                scene[kind] = future.result()
+                if len(scene) == 2 and burn_subtitles:
+                    renderer.submit(i, scene["video"], scene["audio"], captions[i])
+
+            if not burn_subtitles:
+                scenes = [(downloaded[i]["video"], downloaded[i]["audio"], captions[i]) for i in sorted(downloaded)]
+                probes = [probe_video(video_path) for video_path, _, _ in scenes]
+                # 流复制保留原分辨率；高于档位画面（如 1080p 素材出 480p 预览）时必须缩放重新编码
+                too_tall = settings.get("height") and any(probe and probe["height"] > settings["height"]
+                                                          for probe in probes)
+                if too_tall:
+                    print(f"[合成] 场景视频高于 {settings['height']}p，按 {profile} 档位缩放重新编码")
+                elif can_stream_copy(probes):
+                    durations = [probe["duration"] for probe in probes]
+
+                    def produce(path):
+                        with tracer.span("render.stream_copy", segments=len(scenes), profile=profile):
+                            return copy_merge(scenes, durations, path, workspace.path, settings)
+
+                    try:
+                        return _publish(workspace, _stream_copy_key(scenes, settings), output_path, produce)
+                    except Exception as e:
+                        print(f"[合成] 流复制失败，改为逐场景重新编码：{e}")
+                else:
+                    print("[合成] 场景视频的编码参数不一致，改为逐场景重新编码")
+                for i, (video_path, audio_path, caption) in enumerate(scenes):
+                    renderer.submit(i, video_path, audio_path, caption)
+            segment_paths = renderer.results()
+
+            def concat(path):
+                with tracer.span("render.concat", segments=len(segment_paths), profile=profile):
+                    concat_segments(segment_paths, path)
+
+            # 拼接完成前片段保持固定，退出 with 块后才允许淘汰
+            return _publish(workspace, renderer.output_key(), output_path, concat)
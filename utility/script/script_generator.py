@@ -1,23 +1,70 @@
+import functools
+import json
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
 
 from openai import OpenAI
 
+from utility.metrics import tracer
+
+# DeepSeek 接口地址，基准测试时指向本地模拟服务
+DEEPSEEK_API_BASE = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1")
+# 修改下方 prompt 时请同步递增，旧版本 prompt 生成的剧本不会再被复用
+PROMPT_VERSION = 1
+# 剧本缓存的最大条目数与有效期（秒）
+SCRIPT_CACHE_SIZE = 128
+SCRIPT_CACHE_TTL = 3600
 
-def generate_script(topic, language):
+# (topic, language, PROMPT_VERSION) -> (写入时间, script)
+_script_cache = OrderedDict()
+_script_cache_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=4)
+def _get_client(api_key):
+    # 复用同一个客户端及其连接池，避免每次调用都重新建立连接
+    return OpenAI(
+        api_key=api_key,
+        base_url=DEEPSEEK_API_BASE
+    )
+
+
+def _get_deepseek_client():
     deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
 
     if deepseek_api_key:
         print("使用 DeepSeek]")
-        client = OpenAI(
-            api_key=deepseek_api_key,
-            base_url="https://api.deepseek.com/v1"
-        )
-        model = "deepseek-chat"
+        return _get_client(deepseek_api_key), "deepseek-chat"
     else:
         print("没找到DeepSeek API key,返回]")
         raise EnvironmentError("未设置 DEEPSEEK_API_KEY 环境变量，请检查 .env 文件或系统环境变量")
 
-    # 根据语言选择 prompt
+
+def _cache_get(key):
+    with _script_cache_lock:
+        item = _script_cache.get(key)
+        if item is None:
+            return None
+        created, script = item
+        if time.time() - created > SCRIPT_CACHE_TTL:
+            del _script_cache[key]
+            return None
+        _script_cache.move_to_end(key)
+        return script
+
+
+def _cache_put(key, script):
+    with _script_cache_lock:
+        _script_cache[key] = (time.time(), script)
+        _script_cache.move_to_end(key)
+        while len(_script_cache) > SCRIPT_CACHE_SIZE:
+            _script_cache.popitem(last=False)
+
+
+def _build_prompt(language):
     if language == 1:  # 中文
         prompt = (
             """你是一位擅长创意写作和绘本创作的专家，专门将校园相关的创意转化为“五句话的绘本故事”。
@@ -57,24 +104,111 @@ def generate_script(topic, language):
         Now, based on the user's input, please generate a five-sentence campus picture-book style story.
         """
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": topic}
-        ],
+    return prompt
 
-    )
+
+def _record_usage(model, usage):
+    if usage is not None:
+        tracer.add("deepseek_tokens", usage.prompt_tokens, model=model, type="prompt")
+        tracer.add("deepseek_tokens", usage.completion_tokens, model=model, type="completion")
+
+
+def generate_script(topic, language, use_cache=True):
+    cache_key = (topic, language, PROMPT_VERSION)
+    if use_cache:
+        script = _cache_get(cache_key)
+        if script is not None:
+            print("[命中剧本缓存]:", script)
+            return script
+
+    client, model = _get_deepseek_client()
+    with tracer.span("deepseek.script", model=model):
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": _build_prompt(language)},
+                {"role": "user", "content": topic}
+            ],
+
+        )
+    _record_usage(model, response.usage)
     content = response.choices[0].message.content
     print("[原始输出]:", content)
 
     script = extract_json_script(content)
     print("[提取脚本]:", script)
+    _cache_put(cache_key, script)
     return script
 
 
-import json
-import re
+def split_sentences(script, language):
+    """按语言的句子分隔符（中文：。；英文：.）切分剧本，只返回以分隔符结尾的完整句子。"""
+    delimiters = "。" if language == 1 else "."
+    pattern = rf"([^{delimiters}]*[{delimiters}])"
+    return [seg.strip() for seg in re.findall(pattern, script) if seg.strip()]
+
+
+def stream_script_sentences(topic, language, use_cache=True, on_script=None):
+    """
+    流式生成剧本，每写完一句就立即 yield 该句，供下游提前开始切分场景、生成图片。
+
+    命中缓存时直接逐句返回缓存的剧本；流结束后完整剧本写入缓存。
+    on_script(script) 在得到完整剧本时（生成器结束之前）回调，调用方不必再请求一次 generate_script
+    （缓存可能已被淘汰，重新生成的剧本与场景对不上）。
+    """
+    cache_key = (topic, language, PROMPT_VERSION)
+    if use_cache:
+        script = _cache_get(cache_key)
+        if script is not None:
+            if on_script is not None:
+                on_script(script)
+            yield from split_sentences(script, language)
+            return
+
+    client, model = _get_deepseek_client()
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": _build_prompt(language)},
+            {"role": "user", "content": topic}
+        ],
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+
+    content = ""
+    emitted = 0
+    started_at = time.perf_counter()
+    first_sentence_ms = None
+    for chunk in stream:
+        # 开启 include_usage 后最后一个 chunk 只带用量、不带 choices
+        _record_usage(model, getattr(chunk, "usage", None))
+        if not chunk.choices:
+            continue
+        content += chunk.choices[0].delta.content or ""
+        # 找到 "script" 字段值的开头，只对已经写出的部分切句
+        start = re.search(r'"script"\s*:\s*"', content)
+        if not start:
+            continue
+        partial = content[start.end():].split('"', 1)[0]
+        sentences = split_sentences(partial, language)
+        for sentence in sentences[emitted:]:
+            if first_sentence_ms is None:
+                first_sentence_ms = (time.perf_counter() - started_at) * 1000
+            yield sentence
+        emitted = len(sentences)
+
+    tracer.record_span("deepseek.script_stream", (time.perf_counter() - started_at) * 1000, model=model,
+                       first_sentence_ms=first_sentence_ms)
+    print("[原始输出]:", content)
+    script = extract_json_script(content)
+    print("[提取脚本]:", script)
+    _cache_put(cache_key, script)
+    if on_script is not None:
+        on_script(script)
+    # 兜底：流式阶段没能识别出的句子在这里补齐
+    for sentence in split_sentences(script, language)[emitted:]:
+        yield sentence
 
 
 def extract_json_script(raw_str):
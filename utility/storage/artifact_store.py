@@ -0,0 +1,88 @@
+import json
+import os
+import shutil
+import time
+import uuid
+
+from utility.storage import file_server
+
+# 可下载产物的存放目录，由文件服务按 /artifacts/<id><扩展名> 对外提供
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+ARTIFACT_PREFIX = "artifacts"
+
+
+class ArtifactStore:
+    """
+    本地产物仓库：文件按 ID 保存，通过文件服务按需流式下载。
+
+    调用方只需保存 ID（或由 ID 生成的链接），文件内容不会进入 session_state，
+    也不会随页面重跑反复发送给浏览器。
+    """
+
+    def __init__(self, root=ARTIFACT_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _meta_path(self, artifact_id):
+        return os.path.join(self.root, f"{artifact_id}.json")
+
+    def add(self, path_or_bytes, filename):
+        """保存文件或二进制内容，返回产物 ID。本地文件优先用硬链接，避免复制数据。"""
+        artifact_id = uuid.uuid4().hex
+        ext = os.path.splitext(filename)[-1]
+        stored_name = f"{artifact_id}{ext}"
+        target = os.path.join(self.root, stored_name)
+
+        if isinstance(path_or_bytes, bytes):
+            with open(target, "wb") as f:
+                f.write(path_or_bytes)
+        else:
+            try:
+                os.link(path_or_bytes, target)
+            except OSError:
+                shutil.copyfile(path_or_bytes, target)
+
+        meta = {"file": stored_name, "filename": filename, "size": os.path.getsize(target), "created": time.time()}
+        with open(self._meta_path(artifact_id), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return artifact_id
+
+    def get(self, artifact_id):
+        """返回产物的元数据（file / filename / size / created），不存在时返回 None。"""
+        try:
+            with open(self._meta_path(artifact_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def path(self, artifact_id):
+        meta = self.get(artifact_id)
+        return os.path.join(self.root, meta["file"]) if meta else None
+
+    def url(self, artifact_id, download=True):
+        """产物的下载地址；download=False 时返回可直接播放的地址。"""
+        meta = self.get(artifact_id)
+        if meta is None:
+            return None
+        file_server.mount(ARTIFACT_PREFIX, self.root)
+        return file_server.file_url(ARTIFACT_PREFIX, meta["file"], download_name=meta["filename"] if download else None)
+
+    def delete(self, artifact_id):
+        meta = self.get(artifact_id)
+        if meta is None:
+            return
+        for path in (os.path.join(self.root, meta["file"]), self._meta_path(artifact_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_default_store = None
+
+
+def get_artifact_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = ArtifactStore()
+    return _default_store
@@ -0,0 +1,150 @@
+import mimetypes
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+# 文件服务监听地址；端口为 0（默认）时由系统分配空闲端口，避免和另一个 Streamlit 实例（8502 等）冲突。
+# 浏览器访问时使用 FILE_SERVER_PUBLIC_URL，未设置时为 http://localhost:<实际监听的端口>
+# （部署在远程机器时需要固定端口，并把它改成外部可访问的地址）
+FILE_SERVER_HOST = os.getenv("FILE_SERVER_HOST", "127.0.0.1")
+FILE_SERVER_PORT = int(os.getenv("FILE_SERVER_PORT", 0))
+FILE_SERVER_PUBLIC_URL = os.getenv("FILE_SERVER_PUBLIC_URL")
+
+_RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+# URL 前缀 -> 本地目录
+_mounts = {}
+# 路径 -> 返回 (content_type, body) 的函数，用于 /metrics 这类动态内容
+_routes = {}
+_server = None
+_lock = threading.Lock()
+
+
+class _RangeFileHandler(BaseHTTPRequestHandler):
+    """
+    按 Range 请求分段返回本地文件，文件内容通过 socket.sendfile 直接从磁盘发送，
+    不经过 Python 内存，浏览器拖动进度条时也只读取需要的部分。
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _resolve(self):
+        parsed = urlparse(self.path)
+        prefix, _, rel_path = unquote(parsed.path).lstrip("/").partition("/")
+        root = _mounts.get(prefix)
+        if root is None or not rel_path:
+            return None, parsed
+        path = os.path.realpath(os.path.join(root, rel_path))
+        # 防止 ../ 越出挂载目录
+        if not path.startswith(os.path.realpath(root) + os.sep) or not os.path.isfile(path):
+            return None, parsed
+        return path, parsed
+
+    def _send_file(self, send_body):
+        path, parsed = self._resolve()
+        if path is None:
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+        match = _RANGE_PATTERN.match(self.headers.get("Range", ""))
+        if match and size > 0:
+            first, last = match.groups()
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            elif last:
+                start = max(size - int(last), 0)
+            if start > end or start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            status = 206
+        length = end - start + 1 if size > 0 else 0
+
+        self.send_response(status)
+        self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        download_name = parse_qs(parsed.query).get("download", [None])[0]
+        if download_name:
+            self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(download_name)}")
+        self.end_headers()
+
+        if send_body and length > 0:
+            with open(path, "rb") as f:
+                try:
+                    self.connection.sendfile(f, offset=start, count=length)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 浏览器拖动进度条时会主动断开旧连接
+                    pass
+
+    def do_HEAD(self):
+        self._send_file(send_body=False)
+
+    def _send_route(self, handler):
+        content_type, body = handler()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        handler = _routes.get(urlparse(self.path).path.strip("/"))
+        if handler is not None:
+            self._send_route(handler)
+            return
+        self._send_file(send_body=True)
+
+
+def ensure_file_server():
+    """在后台线程中启动进程内共享的文件服务（只启动一次）。"""
+    global _server
+    with _lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((FILE_SERVER_HOST, FILE_SERVER_PORT), _RangeFileHandler)
+            except OSError as e:
+                # 指定的端口被其他程序占用时改用系统分配的空闲端口，URL 按实际端口生成
+                _server = ThreadingHTTPServer((FILE_SERVER_HOST, 0), _RangeFileHandler)
+                print(f"[文件服务] {FILE_SERVER_HOST}:{FILE_SERVER_PORT} 无法监听（{e}），"
+                      f"改用端口 {_server.server_address[1]}")
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="file-server", daemon=True).start()
+        return _server
+
+
+def public_url():
+    """文件服务的公开地址，未设置 FILE_SERVER_PUBLIC_URL 时按实际监听的端口生成。"""
+    server = ensure_file_server()
+    return FILE_SERVER_PUBLIC_URL or f"http://localhost:{server.server_address[1]}"
+
+
+def mount(prefix, directory):
+    """把本地目录挂载到 /<prefix>/ 下，返回该前缀的公开 URL。"""
+    os.makedirs(directory, exist_ok=True)
+    _mounts[prefix] = directory
+    return f"{public_url()}/{prefix}"
+
+
+def route(path, handler):
+    """注册动态路径 /<path>，handler() 返回 (content_type, body 字节)，返回该路径的公开 URL。"""
+    _routes[path] = handler
+    return f"{public_url()}/{path}"
+
+
+def file_url(prefix, rel_path, download_name=None):
+    url = f"{public_url()}/{prefix}/{quote(rel_path)}"
+    if download_name:
+        url += f"?download={quote(download_name)}"
+    return url
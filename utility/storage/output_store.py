@@ -0,0 +1,31 @@
+import os
+
+from utility.storage import file_server
+
+# 合成结果的存放目录，由文件服务按 /outputs/<文件名> 对外提供
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", "outputs")
+OUTPUT_PREFIX = "outputs"
+
+
+def content_output_path(content_key, suffix=".mp4"):
+    """按内容摘要命名的输出路径：输入相同的合成结果落在同一个文件上，可以直接复用。"""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    return os.path.join(OUTPUT_DIR, f"{content_key[:32]}{suffix}")
+
+
+def sidecar_subtitle_path(video_path):
+    """合成视频旁边同名的 .srt 软字幕文件路径。"""
+    return f"{os.path.splitext(video_path)[0]}.srt"
+
+
+def subtitle_file(video_path):
+    """返回合成视频的软字幕文件，字幕已烧进画面（没有 .srt）时返回 None。"""
+    path = sidecar_subtitle_path(video_path)
+    return path if os.path.exists(path) else None
+
+
+def output_url(path, download_name=None):
+    """返回输出文件的播放/下载地址，浏览器通过 Range 请求直接从磁盘流式读取。"""
+    file_server.mount(OUTPUT_PREFIX, OUTPUT_DIR)
+    rel_path = os.path.relpath(path, OUTPUT_DIR)
+    return file_server.file_url(OUTPUT_PREFIX, rel_path, download_name=download_name)
@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+# 渲染 / 下载任务的临时工作目录根目录；每个任务在其下拥有独立子目录
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", ".workspaces")
+# 所有工作目录的总大小上限（字节），超出时从最旧的闲置目录开始清理
+WORKSPACE_MAX_BYTES = int(os.getenv("WORKSPACE_MAX_BYTES", 5 * 1024 ** 3))
+# 闲置超过该秒数的工作目录会被清理（包括进程崩溃后遗留的目录）
+WORKSPACE_MAX_AGE = int(os.getenv("WORKSPACE_MAX_AGE", 24 * 3600))
+# 设为 1 时任务结束后保留临时文件，便于调试
+KEEP_WORKSPACES = os.getenv("KEEP_WORKSPACES", "0") == "1"
+OWNER_FILE = ".owner"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 没有权限发送信号说明进程仍然存在
+        return True
+    return True
+
+
+def _dir_stats(path):
+    """返回目录的 (总字节数, 最近修改时间)。"""
+    size, mtime = 0, os.path.getmtime(path)
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                stat = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+    return size, mtime
+
+
+class Workspace:
+    """
+    单个任务独占的临时目录。
+
+    作为上下文管理器使用时，退出 with 块即删除目录；keep=True 的工作目录（如流水线下载的素材，
+    之后还要用来合成）不随任务结束删除，由 WorkspaceManager 按闲置时间和总大小清理，
+    使用其中文件的一方需要在文件已被清理时退回原始来源（如远程 URL）。
+    """
+
+    def __init__(self, manager, path, keep=False):
+        self.manager = manager
+        self.path = path
+        self.keep = keep
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def release(self):
+        self.manager.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self.keep:
+            self.release()
+
+
+class WorkspaceManager:
+    """
+    分配并清理工作目录，使同一台机器上的多个会话 / 进程可以同时渲染而互不干扰。
+
+    每个目录下的 .owner 记录创建它的进程；创建新目录时顺带清理：
+    所属进程已退出的临时目录、闲置超过 max_age 的目录，以及总大小超过 max_bytes 时最旧的闲置目录。
+    本进程正在使用的临时目录（keep=False，尚未 release）永远不会被清理；keep=True 的目录不在此列。
+    """
+
+    def __init__(self, root=WORKSPACE_DIR, max_bytes=WORKSPACE_MAX_BYTES, max_age=WORKSPACE_MAX_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._active = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def create(self, label="job", keep=False):
+        self.collect()
+        path = os.path.join(self.root, f"{label}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}")
+        os.makedirs(path)
+        with open(os.path.join(path, OWNER_FILE), "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "keep": keep, "created": time.time()}, f)
+        workspace = Workspace(self, path, keep=keep)
+        if not keep:
+            with self._lock:
+                self._active.add(path)
+        return workspace
+
+    def release(self, workspace):
+        with self._lock:
+            self._active.discard(workspace.path)
+        if not KEEP_WORKSPACES:
+            shutil.rmtree(workspace.path, ignore_errors=True)
+
+    def _owner(self, path):
+        try:
+            with open(os.path.join(path, OWNER_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def collect(self):
+        """按闲置时间和总大小清理不再使用的工作目录，返回删除的目录数。"""
+        with self._lock:
+            active = set(self._active)
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path) or path in active:
+                continue
+            try:
+                size, mtime = _dir_stats(path)
+            except OSError:
+                continue
+            entries.append((mtime, size, path, self._owner(path)))
+
+        removed = 0
+        total = sum(size for _, size, _, _ in entries)
+        for mtime, size, path, owner in sorted(entries):
+            orphaned = not owner.get("keep") and not _pid_alive(owner.get("pid", 0))
+            # 其他进程中仍在使用的临时目录只在闲置过久时清理
+            evictable = owner.get("keep") or orphaned
+            if orphaned or now - mtime > self.max_age or (evictable and total > self.max_bytes):
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                removed += 1
+        return removed
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_workspace_manager():
+    """进程内共享的工作目录管理器。"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = WorkspaceManager()
+        return _manager
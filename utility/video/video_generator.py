@@ -0,0 +1,38 @@
+from utility.cache.asset_cache import get_asset_cache
+from utility.network import http_client
+from utility.network.rate_limiter import call_limited, describe_wait
+from utility.vidu.poller import creation_url, get_vidu_poller
+from utility.vidu.task_scheduler import img2video_payload, video_cache_key
+
+
+# 图生视频
+def generate_video(img_url, prompt, on_state=None, poller=None):
+    """
+    提交 Vidu img2video 任务并等待完成，返回视频 URL（命中缓存时可能是本地路径）。
+
+    on_state(state) 在每次查询到任务状态后回调，可用于展示进度。
+    相同参数的任务已在生成（其他会话或并发调用）时不再提交，等待同一个任务的结果。
+    """
+    poller = poller or get_vidu_poller()
+    cache = get_asset_cache()
+    payload = img2video_payload(img_url, prompt)
+    cache_key = video_cache_key(cache, img_url, payload)
+
+    def submit_and_wait():
+        res = call_limited(
+            "vidu",
+            lambda: http_client.post(f"{poller.api_base}/img2video", headers=poller.headers, json=payload),
+            model=payload["model"],
+            on_wait=(lambda position, wait: on_state(describe_wait(position, wait))) if on_state else None)
+        if res.status_code != 200:
+            raise Exception(f"视频生成请求失败：{res.status_code}")
+        res_json = res.json()
+        task_id = res_json["task_id"]
+        poller.submitted(task_id, "video", res_json)
+        poll_json = poller.wait(task_id, on_state=on_state)
+        return creation_url(task_id, poll_json)
+
+    # 相同参数的任务正在生成时直接等待它的结果，不重复提交
+    return cache.get_or_create(
+        cache_key, submit_and_wait, kind="video", timeout=poller.deadline,
+        on_join=(lambda: on_state("已有相同的任务在生成，等待其结果")) if on_state else None)
@@ -0,0 +1,225 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from utility.metrics import tracer
+from utility.network import http_client
+
+# Vidu 接口地址，基准测试时指向本地模拟服务
+VIDU_API_BASE = os.getenv("VIDU_API_BASE", "https://api.vidu.cn/ent/v2")
+
+# 各状态下的基础轮询间隔（秒）：排队时任务短时间内不会结束，处理中则随时可能完成
+STATE_INTERVALS = {
+    "created": 1.0,
+    "queueing": 3.0,
+    "processing": 1.0,
+}
+# 未知状态使用的基础间隔
+DEFAULT_INTERVAL = 2.0
+# 同一状态持续时，每次轮询后间隔乘以该系数
+BACKOFF_FACTOR = 1.5
+MAX_INTERVAL = 10.0
+# 间隔随机抖动比例，避免多个任务同时打到接口
+JITTER = 0.2
+# 提交后第一次查询前的等待秒数
+INITIAL_DELAY = 1.0
+# 单个任务（或一批任务）的最长等待秒数
+DEFAULT_DEADLINE = 600
+# 按结果 URL 保留最近多少个成功任务的耗时和额度消耗，供历史记录查询
+USAGE_HISTORY_SIZE = 1000
+
+TERMINAL_STATES = ("success", "failed")
+# 任务状态 -> 统计阶段：排队等待 / 服务端处理
+STATE_PHASES = {
+    "created": "queue",
+    "queueing": "queue",
+    "processing": "processing",
+}
+
+
+class PollTimeout(TimeoutError):
+    pass
+
+
+class TaskQueryError(Exception):
+    """查询任务状态的接口返回了非 2xx 状态码。"""
+
+    def __init__(self, task_id, status_code):
+        super().__init__(f"任务 {task_id} 状态查询失败：{status_code}")
+        self.status_code = status_code
+
+    @property
+    def permanent(self):
+        # 鉴权失败、任务不存在等 4xx 重试也不会成功；超时和限流（408 / 429）以及 5xx 可以重试
+        return 400 <= self.status_code < 500 and self.status_code not in (408, 429)
+
+
+def creation_url(task_id, poll_json):
+    """从成功任务的查询结果中取出生成的资源 URL，缺失时抛出 Exception。"""
+    try:
+        return poll_json["creations"][0]["url"]
+    except (KeyError, IndexError, TypeError):
+        raise Exception(f"任务 {task_id} 已成功但没有返回生成结果") from None
+
+
+class PollBackoff:
+    """
+    根据任务最近一次上报的状态计算下一次轮询间隔。
+
+    状态变化时间隔回到该状态的基础值；状态不变时按 BACKOFF_FACTOR 指数增长，
+    不超过 max_interval，并叠加 ±jitter 的随机抖动。
+    """
+
+    def __init__(self, state_intervals=None, backoff_factor=BACKOFF_FACTOR, max_interval=MAX_INTERVAL,
+                 jitter=JITTER):
+        self.state_intervals = state_intervals or STATE_INTERVALS
+        self.backoff_factor = backoff_factor
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.state = None
+        self.same_state_polls = 0
+
+    def next_interval(self, state):
+        if state != self.state:
+            self.state = state
+            self.same_state_polls = 0
+        base = self.state_intervals.get(state, DEFAULT_INTERVAL)
+        interval = min(base * self.backoff_factor ** self.same_state_polls, self.max_interval)
+        self.same_state_polls += 1
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class TaskPoller:
+    """
+    查询 Vidu 任务状态的轮询器。
+
+    每次查询只解析一次响应；poll_counts 记录每个任务累计查询次数，便于调整参数。
+    api_base 可以指向本地的模拟服务用于测试。
+    """
+
+    def __init__(self, api_key, api_base=VIDU_API_BASE, deadline=DEFAULT_DEADLINE, initial_delay=INITIAL_DELAY,
+                 **backoff_kwargs):
+        self.api_base = api_base
+        self.deadline = deadline
+        self.initial_delay = initial_delay
+        self.backoff_kwargs = backoff_kwargs
+        self.headers = {"Authorization": f"Token {api_key}", "Content-Type": "application/json"}
+        self.poll_counts = {}
+        # task_id -> {"kind", "submitted_at", "phase", "phase_since", "credits"}，用于统计各阶段耗时
+        self._phases = {}
+        # 结果 URL -> {"duration_ms", "cost"}
+        self._usage = OrderedDict()
+        self._lock = threading.Lock()
+
+    def new_backoff(self):
+        return PollBackoff(**self.backoff_kwargs)
+
+    def submitted(self, task_id, kind, response_json=None):
+        """登记刚提交的任务，之后的查询会按状态统计排队和处理耗时；响应中的 credits 计入额度消耗。"""
+        now = time.monotonic()
+        credits = (response_json or {}).get("credits")
+        with self._lock:
+            self._phases[task_id] = {"kind": kind, "submitted_at": now, "phase": "queue", "phase_since": now,
+                                     "credits": credits}
+        if credits:
+            tracer.add("vidu_credits", credits, kind=kind)
+
+    def _observe(self, task_id, state):
+        # 任务结束时返回 {"duration_ms", "cost"}，否则返回 None
+        now = time.monotonic()
+        with self._lock:
+            task = self._phases.get(task_id)
+            if task is None:
+                return
+            phase = STATE_PHASES.get(state, task["phase"])
+            finished = state in TERMINAL_STATES
+            if not finished and phase == task["phase"]:
+                return
+            ended_phase, since = task["phase"], task["phase_since"]
+            task.update(phase=phase, phase_since=now)
+            if finished:
+                del self._phases[task_id]
+        # 阶段结束时刻以查询到新状态的时间为准，误差不超过一个轮询间隔
+        tracer.record_span(f"vidu.{ended_phase}", (now - since) * 1000, kind=task["kind"], task_id=task_id)
+        if finished:
+            duration_ms = (now - task["submitted_at"]) * 1000
+            tracer.record_span("vidu.task", duration_ms,
+                               status="ok" if state == "success" else "error", kind=task["kind"], task_id=task_id,
+                               polls=self.poll_counts.get(task_id, 0))
+            return {"duration_ms": duration_ms, "cost": task["credits"]}
+        return None
+
+    def fetch(self, task_id):
+        """查询一次任务状态，返回解析后的 JSON；接口返回非 2xx 时抛出 TaskQueryError。"""
+        with self._lock:
+            self.poll_counts[task_id] = self.poll_counts.get(task_id, 0) + 1
+        poll = http_client.get(f"{self.api_base}/tasks/{task_id}/creations", headers=self.headers)
+        if not 200 <= poll.status_code < 300:
+            raise TaskQueryError(task_id, poll.status_code)
+        poll_json = poll.json()
+        usage = self._observe(task_id, poll_json.get("state", ""))
+        if usage is not None and poll_json.get("state") == "success":
+            try:
+                url = creation_url(task_id, poll_json)
+            except Exception:
+                return poll_json
+            with self._lock:
+                self._usage[url] = usage
+                while len(self._usage) > USAGE_HISTORY_SIZE:
+                    self._usage.popitem(last=False)
+        return poll_json
+
+    def usage(self, url):
+        """
+        生成 url 的任务从提交到完成的耗时（毫秒）和消耗的积分：{"duration_ms", "cost"}；
+        不是本进程最近轮询到的结果（如命中缓存）时返回空 dict。
+        """
+        with self._lock:
+            return dict(self._usage.get(url, {}))
+
+    def wait(self, task_id, on_state=None):
+        """
+        阻塞轮询单个任务直到结束，成功时返回最后一次的查询结果。
+
+        任务失败或查询接口返回 4xx（如鉴权失败、任务不存在）抛出 Exception，超过 deadline 抛出 PollTimeout；
+        5xx、408、429 视为暂时性错误，退避后继续查询。
+        """
+        backoff = self.new_backoff()
+        deadline_at = time.monotonic() + self.deadline
+        delay = self.initial_delay
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise PollTimeout(f"任务 {task_id} 轮询超时（{self.deadline} 秒）")
+            time.sleep(min(delay, remaining))
+
+            try:
+                poll_json = self.fetch(task_id)
+            except TaskQueryError as e:
+                if e.permanent:
+                    raise
+                delay = backoff.next_interval(None)
+                continue
+            state = poll_json.get("state", "")
+            if on_state is not None:
+                on_state(state)
+            if state == "success":
+                return poll_json
+            if state == "failed":
+                raise Exception(f"任务 {task_id} 生成失败")
+            delay = backoff.next_interval(state)
+
+
+_default_poller = None
+_default_poller_lock = threading.Lock()
+
+
+def get_vidu_poller():
+    """进程内共享的轮询器，使用环境变量 VIDU_API_KEY（需先加载 .env）。"""
+    global _default_poller
+    with _default_poller_lock:
+        if _default_poller is None:
+            _default_poller = TaskPoller(os.getenv("VIDU_API_KEY"))
+        return _default_poller
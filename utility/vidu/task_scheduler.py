@@ -0,0 +1,316 @@
+import base64
+import mimetypes
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utility.cache.asset_cache import is_local_ref, make_key
+from utility.metrics import tracer
+from utility.network import http_client
+from utility.network.rate_limiter import call_limited, describe_wait
+from utility.vidu.poller import VIDU_API_BASE, TaskPoller, TaskQueryError, creation_url
+
+# 同一轮中并发查询任务状态的最大线程数
+MAX_CONCURRENT_POLLS = 8
+
+# 任务类型
+TASK_VIDEO = "video"
+TASK_AUDIO = "audio"
+
+# img2video 生成的视频时长（秒）；背景音默认按这个时长生成
+VIDEO_DURATION = "5"
+# text2audio 接受的时长范围（秒）
+AUDIO_MIN_DURATION = 2.0
+AUDIO_MAX_DURATION = 10.0
+
+
+def build_audio_prompt(text):
+    return "舒缓小声的，音色干净的不要炸耳朵的，为" + text + "场景做的的轻快连贯重复不停的背景音乐"
+
+
+def audio_duration_for(video_ref=None):
+    """
+    背景音应生成的时长：给出场景视频（本地路径或 URL）时按其实际时长，否则按请求的视频时长，
+    限制在 text2audio 接受的范围内并保留一位小数。
+    """
+    duration = None
+    if video_ref:
+        from utility.render.probe import probe_duration
+        duration = probe_duration(video_ref)
+    duration = duration or float(VIDEO_DURATION)
+    return round(min(max(duration, AUDIO_MIN_DURATION), AUDIO_MAX_DURATION), 1)
+
+
+def image_input(image_ref):
+    """Vidu 的 images 字段同时接受 URL 和 base64 data URI，本地缓存文件转成 data URI 提交。"""
+    if not is_local_ref(image_ref):
+        return image_ref
+    mime = mimetypes.guess_type(image_ref)[0] or "image/png"
+    with open(image_ref, "rb") as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode()}"
+
+
+def img2video_payload(image_ref, prompt, duration=VIDEO_DURATION, seed="0", resolution="1080p", movement_amplitude="auto"):
+    return {
+        "model": "viduq1",
+        "images": [image_input(image_ref)],
+        "prompt": prompt,
+        "duration": duration,
+        "seed": seed,
+        "resolution": resolution,
+        "movement_amplitude": movement_amplitude,
+    }
+
+
+def text2audio_payload(prompt, duration=None, seed=0):
+    return {
+        "model": "audio1.0",
+        "prompt": prompt,
+        "duration": duration or audio_duration_for(),
+        "seed": seed
+    }
+
+
+def video_cache_key(cache, image_ref, payload):
+    # 图片 URL 每次生成都不同，优先用图片自身的缓存键标识输入图片
+    params = {k: v for k, v in payload.items() if k != "images"}
+    params["image"] = cache.key_for_ref(image_ref) or image_ref
+    return make_key(TASK_VIDEO, **params)
+
+
+def audio_cache_key(payload):
+    return make_key(TASK_AUDIO, **payload)
+
+
+class ViduTaskScheduler:
+    """
+    统一提交并轮询所有场景的 Vidu 任务（img2video / text2audio）。
+
+    所有任务提交后在同一个轮询循环里查询状态，某个场景的视频和音频都结束后
+    立即回调 on_scene_complete，因此多个场景的总耗时约等于最慢的那个场景。
+    每个任务按自己的状态自适应退避，到期的任务在同一轮里并发查询。
+    传入 cache 时，参数相同的任务直接复用缓存结果，不再向 Vidu 提交；
+    相同参数的任务正在生成（本调度器或其他会话）时加入等待它的结果，而不是重复提交。
+    """
+
+    def __init__(self, api_key, api_base=VIDU_API_BASE, poller=None, cache=None):
+        self.poller = poller or TaskPoller(api_key, api_base=api_base)
+        self.api_base = self.poller.api_base
+        self.headers = self.poller.headers
+        self.cache = cache
+        # task_id -> 缓存键
+        self._cache_keys = {}
+        # task_id -> (scene_idx, kind)
+        self.pending = {}
+        # 加入其他调用方正在生成的相同任务：Future -> (scene_idx, kind)
+        self.joined = {}
+        # 加入的任务结束时唤醒轮询循环
+        self._wakeup = threading.Event()
+        # task_id -> (PollBackoff, 下一次查询的 monotonic 时间)
+        self._schedule = {}
+        # scene_idx -> {"video": url, "audio": url, "errors": {kind: message}}
+        self.results = {}
+
+    def _scene(self, scene_idx):
+        return self.results.setdefault(scene_idx, {TASK_VIDEO: None, TASK_AUDIO: None, "errors": {}})
+
+    def _submit(self, scene_idx, kind, endpoint, payload, cache_key=None, on_wait=None):
+        scene = self._scene(scene_idx)
+        scene[kind] = None
+        scene["errors"].pop(kind, None)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                scene[kind] = cached
+                return None
+            future, leader = self.cache.in_flight.begin(cache_key)
+            if not leader:
+                tracer.add("single_flight_joined", kind=kind)
+                self.joined[future] = (scene_idx, kind)
+                future.add_done_callback(lambda _: self._wakeup.set())
+                return None
+            # 成为发起者之前，上一个相同任务可能刚刚写入缓存
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.cache.in_flight.finish(cache_key, cached)
+                scene[kind] = cached
+                return None
+        try:
+            # 提交受 Vidu 限流器约束，被限流（429）时放慢速率后重新排队
+            res = call_limited(
+                "vidu",
+                lambda: http_client.post(f"{self.api_base}/{endpoint}", headers=self.headers, json=payload),
+                model=payload["model"], on_wait=on_wait)
+            if res.status_code != 200:
+                raise Exception(f"请求失败：{res.status_code}")
+            res_json = res.json()
+            task_id = res_json["task_id"]
+        except Exception as e:
+            scene["errors"][kind] = str(e)
+            if cache_key is not None:
+                self.cache.in_flight.finish(cache_key, error=e)
+            return None
+        self.poller.submitted(task_id, kind, res_json)
+        self.pending[task_id] = (scene_idx, kind)
+        if cache_key is not None:
+            self._cache_keys[task_id] = cache_key
+        self._schedule[task_id] = (self.poller.new_backoff(), time.monotonic() + self.poller.initial_delay)
+        return task_id
+
+    def submit_img2video(self, scene_idx, image_url, prompt, on_wait=None, **options):
+        payload = img2video_payload(image_url, prompt, **options)
+        cache_key = video_cache_key(self.cache, image_url, payload) if self.cache is not None else None
+        return self._submit(scene_idx, TASK_VIDEO, "img2video", payload, cache_key, on_wait)
+
+    def submit_text2audio(self, scene_idx, prompt, duration=None, seed=0, on_wait=None):
+        payload = text2audio_payload(prompt, duration=duration, seed=seed)
+        cache_key = audio_cache_key(payload) if self.cache is not None else None
+        return self._submit(scene_idx, TASK_AUDIO, "text2audio", payload, cache_key, on_wait)
+
+    def _scene_done(self, scene_idx):
+        return all(idx != scene_idx for idx, _ in [*self.pending.values(), *self.joined.values()])
+
+    @property
+    def poll_counts(self):
+        """每个任务累计的状态查询次数。"""
+        return self.poller.poll_counts
+
+    def _fetch(self, task_id):
+        try:
+            return self.poller.fetch(task_id), None
+        except Exception as e:
+            return None, e
+
+    def _finish(self, task_id, on_scene_complete):
+        scene_idx, kind = self.pending.pop(task_id)
+        self._schedule.pop(task_id, None)
+        cache_key = self._cache_keys.pop(task_id, None)
+        if cache_key is not None:
+            # 唤醒等待同一任务的其他调用方
+            scene = self._scene(scene_idx)
+            error = scene["errors"].get(kind)
+            self.cache.in_flight.finish(cache_key, scene[kind], Exception(error) if error else None)
+        self._complete(scene_idx, on_scene_complete)
+
+    def _complete(self, scene_idx, on_scene_complete):
+        if self._scene_done(scene_idx) and on_scene_complete is not None:
+            on_scene_complete(scene_idx, self._scene(scene_idx))
+
+    def _collect_joined(self, on_scene_complete):
+        for future, (scene_idx, kind) in list(self.joined.items()):
+            if not future.done():
+                continue
+            del self.joined[future]
+            if future.exception() is None:
+                self._scene(scene_idx)[kind] = future.result()
+            else:
+                self._scene(scene_idx)["errors"][kind] = str(future.exception())
+            self._complete(scene_idx, on_scene_complete)
+
+    def _store(self, task_id, url):
+        cache_key = self._cache_keys.get(task_id)
+        if cache_key is None:
+            return
+        try:
+            self.cache.put_url(cache_key, url)
+        except Exception as e:
+            # 缓存写入失败不影响本次生成结果
+            print(f"[缓存写入失败] {task_id}: {e}")
+
+    def run(self, on_scene_complete=None, on_state=None):
+        """
+        在一个共享循环中轮询所有未完成任务，直到全部结束或超过轮询器的 deadline。
+
+        on_state(scene_idx, kind, state) 在每次查询到状态后回调；
+        on_scene_complete(scene_idx, result) 在某个场景的所有任务都结束后回调一次。
+        """
+        # 提交阶段就失败、没有任何任务在跑的场景也需要通知
+        for scene_idx in sorted(self.results):
+            if self._scene_done(scene_idx) and on_scene_complete is not None:
+                on_scene_complete(scene_idx, self.results[scene_idx])
+
+        deadline_at = time.monotonic() + self.poller.deadline
+        try:
+            self._poll_loop(deadline_at, on_scene_complete, on_state)
+        finally:
+            # 循环异常退出时也要唤醒等待本调度器任务的其他调用方
+            for task_id in list(self._cache_keys):
+                self.cache.in_flight.finish(self._cache_keys.pop(task_id), error=Exception("任务已中断"))
+        return self.results
+
+    def _poll_loop(self, deadline_at, on_scene_complete, on_state):
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_POLLS) as executor:
+            while True:
+                # 先清除唤醒标记再检查，避免漏掉检查之后才结束的加入任务
+                self._wakeup.clear()
+                self._collect_joined(on_scene_complete)
+                if not self.pending and not self.joined:
+                    break
+                now = time.monotonic()
+                if now >= deadline_at:
+                    timeout_error = f"轮询超时（{self.poller.deadline} 秒）"
+                    for task_id, (scene_idx, kind) in list(self.pending.items()):
+                        self._scene(scene_idx)["errors"][kind] = timeout_error
+                        self._finish(task_id, on_scene_complete)
+                    for future, (scene_idx, kind) in list(self.joined.items()):
+                        del self.joined[future]
+                        self._scene(scene_idx)["errors"][kind] = timeout_error
+                        self._complete(scene_idx, on_scene_complete)
+                    break
+
+                due = [task_id for task_id in self.pending if self._schedule[task_id][1] <= now]
+                if not due:
+                    wake_at = min((next_at for _, next_at in self._schedule.values()), default=deadline_at)
+                    self._wakeup.wait(max(0, min(wake_at, deadline_at) - now))
+                    continue
+
+                # 到期的任务一起查询，每个响应只解析一次
+                for task_id, (poll_json, error) in zip(due, executor.map(self._fetch, due)):
+                    scene_idx, kind = self.pending[task_id]
+                    backoff, _ = self._schedule[task_id]
+                    if isinstance(error, TaskQueryError) and error.permanent:
+                        # 鉴权失败、任务不存在等错误重试也不会成功，直接结束该任务
+                        self._scene(scene_idx)["errors"][kind] = str(error)
+                        self._finish(task_id, on_scene_complete)
+                        continue
+                    if error is not None:
+                        # 单次查询失败不影响其他任务，按未知状态退避后重试
+                        if on_state is not None:
+                            on_state(scene_idx, kind, f"查询失败：{error}")
+                        self._schedule[task_id] = (backoff, time.monotonic() + backoff.next_interval(None))
+                        continue
+
+                    state = poll_json.get("state", "")
+                    if on_state is not None:
+                        on_state(scene_idx, kind, state)
+                    if state == "success":
+                        # 结果解析失败只记为该任务的错误，不影响其他场景
+                        try:
+                            url = creation_url(task_id, poll_json)
+                        except Exception as e:
+                            self._scene(scene_idx)["errors"][kind] = str(e)
+                        else:
+                            self._scene(scene_idx)[kind] = url
+                            self._store(task_id, url)
+                    elif state == "failed":
+                        self._scene(scene_idx)["errors"][kind] = "生成失败"
+                    else:
+                        self._schedule[task_id] = (backoff, time.monotonic() + backoff.next_interval(state))
+                        continue
+                    self._finish(task_id, on_scene_complete)
+
+    def generate_all_scenes(self, image_urls, video_prompts, audio_prompts, audio_duration=None,
+                            on_scene_complete=None, on_state=None):
+        """一次性提交所有场景的视频和音频任务并等待完成，返回按场景编号索引的结果。"""
+        def waiter(idx, kind):
+            if on_state is None:
+                return None
+            return lambda position, wait: on_state(idx, kind, describe_wait(position, wait))
+
+        for idx, (img_url, video_prompt, audio_prompt) in enumerate(zip(image_urls, video_prompts, audio_prompts)):
+            if img_url:
+                self.submit_img2video(idx, img_url, video_prompt, on_wait=waiter(idx, TASK_VIDEO))
+            else:
+                self._scene(idx)["errors"][TASK_VIDEO] = "场景图片未生成"
+            self.submit_text2audio(idx, audio_prompt, duration=audio_duration, on_wait=waiter(idx, TASK_AUDIO))
+        return self.run(on_scene_complete=on_scene_complete, on_state=on_state)
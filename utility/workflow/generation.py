@@ -0,0 +1,115 @@
+import os
+
+# 视频生成流程的各个步骤（剧本、场景图片、视频/背景音、合成），不依赖 Streamlit，进度通过回调通知调用方。
+# moviepy、dashscope、openai、requests 等较重的依赖只在执行对应步骤时才导入，页面加载时不必付出导入开销。
+
+
+def audio_prompt(text):
+    from utility.vidu.task_scheduler import build_audio_prompt
+    return build_audio_prompt(text)
+
+
+def write_script(topic, language, on_sentence=None):
+    """流式生成剧本，每写完一句回调 on_sentence(sentences)，返回完整剧本。"""
+    from utility.script.script_generator import stream_script_sentences
+
+    scripts = []
+    sentences = []
+    for sentence in stream_script_sentences(topic, language, on_script=scripts.append):
+        sentences.append(sentence)
+        if on_sentence is not None:
+            on_sentence(sentences)
+    return scripts[0]
+
+
+def split_scenes(script, language):
+    from utility.script.script_generator import split_sentences
+    return split_sentences(script, language)
+
+
+def generate_scene_images(scene_texts, style, on_progress=None):
+    """
+    所有场景并发生成图片，返回 (urls, errors)，均按场景顺序排列。
+    on_progress(done, total, idx, error) 每完成一张回调一次。
+    """
+    from utility.image.batch_generator import build_image_prompt, generate_images_concurrently
+    from utility.image.image_generator import generate_single_caption_image
+
+    # 构造带前文的 prompt，保证相邻场景画面连贯
+    prompts = [build_image_prompt(text, scene_texts[idx - 1] if idx > 0 else None)
+               for idx, text in enumerate(scene_texts)]
+    return generate_images_concurrently(generate_single_caption_image, style, prompts, on_progress=on_progress)
+
+
+def generate_scene_clips(image_urls, scene_texts, on_scene_complete=None, on_state=None):
+    """
+    一次性提交所有场景的视频和背景音任务并在同一循环中轮询。
+
+    on_state(scene_idx, kind, state) 与 on_scene_complete(scene_idx, result) 的含义见 ViduTaskScheduler.run，
+    kind 和 result 的键为 "video" / "audio"。
+    """
+    from utility.cache.asset_cache import get_asset_cache
+    from utility.vidu.poller import get_vidu_poller
+    from utility.vidu.task_scheduler import ViduTaskScheduler, build_audio_prompt
+
+    scheduler = ViduTaskScheduler(os.getenv("VIDU_API_KEY"), poller=get_vidu_poller(), cache=get_asset_cache())
+    return scheduler.generate_all_scenes(
+        image_urls,
+        scene_texts,
+        [build_audio_prompt(text) for text in scene_texts],
+        on_scene_complete=on_scene_complete,
+        on_state=on_state,
+    )
+
+
+def generate_scene_video(image_url, text, on_state=None):
+    from utility.video.video_generator import generate_video
+    return generate_video(image_url, text, on_state=on_state)
+
+
+def generate_scene_audio(text, on_state=None, video_ref=None):
+    """video_ref 为已生成的场景视频时，背景音按视频的实际时长生成，合成时不必大幅循环或截断。"""
+    from utility.audio.audio_generator import generate_audio
+    from utility.vidu.task_scheduler import audio_duration_for
+    return generate_audio(prompt=audio_prompt(text), duration=audio_duration_for(video_ref), on_state=on_state)
+
+
+def run_pipeline(topic, language, style, on_scene=None):
+    """
+    流水线一键生成：每句剧本写完就立即进入图片、视频/音频、下载阶段。
+    返回 (script, scenes)，scenes 按场景顺序排列，on_scene(scene) 每完成一个场景回调一次。
+    """
+    from utility.cache.asset_cache import get_asset_cache
+    from utility.image.image_generator import generate_single_caption_image
+    from utility.network.download import download_file
+    from utility.pipeline.scene_pipeline import run_scene_pipeline
+    from utility.storage.workspace import get_workspace_manager
+    from utility.script.script_generator import stream_script_sentences
+    from utility.vidu.poller import get_vidu_poller
+
+    # 下载的素材之后还要用于合成，放在本次生成独占、按闲置时间清理的工作目录中
+    workspace = get_workspace_manager().create("pipeline", keep=True)
+    # 场景和返回的剧本都来自同一次流式生成
+    scripts = []
+    scenes = run_scene_pipeline(
+        stream_script_sentences(topic, language, on_script=scripts.append),
+        generate_single_caption_image,
+        style,
+        os.getenv("VIDU_API_KEY"),
+        download=lambda url, prefix: download_file(url, workspace.path, prefix),
+        poller=get_vidu_poller(),
+        cache=get_asset_cache(),
+        on_scene=on_scene,
+    )
+    return scripts[0], scenes
+
+
+def merge_final_video(video_refs, audio_refs, captions, profile=None):
+    """只合成视频和音频都已生成的场景，返回最终视频的文件路径；profile 为 "preview" 时快速渲染低清预览。"""
+    from utility.render.video_merger import merge_videos_and_audios
+
+    valid_data = [(v, a, c) for v, a, c in zip(video_refs, audio_refs, captions) if v is not None and a is not None]
+    if not valid_data:
+        raise Exception("没有视频和音频都已生成的场景")
+    video_refs, audio_refs, captions = zip(*valid_data)
+    return merge_videos_and_audios(video_refs, audio_refs, captions, profile=profile)